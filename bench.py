@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench.py: Throughput benchmark for pdf-md-scan.py on a synthetic PDF corpus.
+
+Generates deterministic PDFs with PyMuPDF (headings at several font sizes,
+bullet/numbered lists, monospace code, embedded images, optionally
+encrypted) and times each stage of the converter separately, reporting
+pages/sec, MB/sec (of PDF input) and peak RSS per stage.
+
+    python3 bench.py --pages 50,500 --repeat 3
+    python3 bench.py --import-time [--max-import-ms 250]
+    python3 bench.py --ocr [--pages 10]
+    python3 bench.py --wikilinks [--lines 100000] [--terms 20,200,500]
+    python3 bench.py --serve [--requests 200] [--clients 8] [--pages 10,50]
+
+--import-time measures the script's cold start instead (`python -X importtime`),
+listing the slowest imports; with --max-import-ms it exits with status 1 when
+the median start-up exceeds the budget, so it can guard CI.
+
+--ocr renders corpus pages to 600 dpi colour images with an alpha channel
+and OCRs them with and without preprocess_for_ocr(), reporting seconds per
+image, the pixels handed to Tesseract and character accuracy against the
+page's own text.
+
+--wikilinks links synthetic lines (12 words from a 5000-word vocabulary)
+with one term_regex() pattern and with a regex per term, the way link_line()
+worked before, for each number of terms.
+
+--serve compares a cold `pdf-md-scan.py` run per file with requests to a
+`--serve` daemon on a Unix socket: latency percentiles of sequential
+requests, then throughput with several concurrent clients, and the
+daemon's own /stats (queue depth, latency percentiles).
+"""
+import os
+import sys
+import re
+import time
+import contextlib
+import random
+import argparse
+import tempfile
+import difflib
+import statistics
+import subprocess
+import socket
+import http.client
+import json
+import fitz  # PyMuPDF
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "bench"
+
+VOCAB = ("security assessment network vulnerability compliance methodology control access policy "
+         "risk audit incident response firewall encryption identity management threat model asset "
+         "inventory monitoring baseline configuration patch review evidence finding remediation owner "
+         "scope system service endpoint credential privilege segmentation logging retention").split()
+
+
+def make_image(rng, w, h):
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, w, h), 0)
+    pix.set_rect(pix.irect, tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(4):
+        x, y = rng.randrange(w), rng.randrange(h)
+        pix.set_rect(fitz.IRect(x, y, min(w, x + w // 3), min(h, y + h // 3)), tuple(rng.randrange(256) for _ in range(3)))
+    return pix.tobytes("png")
+
+
+def make_pdf(path, pages, seed=0, images=True, password=None):
+    """Write a deterministic synthetic PDF of `pages` pages to `path`."""
+    rng = random.Random(seed)
+    logo = make_image(rng, 60, 20) if images else None   # repeated on every page
+    doc = fitz.open()
+
+    def sentence(n):
+        return ' '.join(rng.choice(VOCAB) for _ in range(n)).capitalize() + '.'
+
+    for i in range(pages):
+        page = doc.new_page()
+        y = 50
+        if logo:
+            page.insert_image(fitz.Rect(480, 20, 540, 40), stream=logo)
+        if i % 5 == 0:
+            page.insert_text((50, y), f"Chapter {i // 5 + 1} {sentence(2)[:-1]}", fontsize=20, fontname="hebo"); y += 30
+        page.insert_text((50, y), sentence(3)[:-1], fontsize=16, fontname="hebo"); y += 24
+        while y < 700:
+            kind = rng.random()
+            if kind < 0.55:
+                for _ in range(rng.randrange(2, 6)):
+                    page.insert_text((50, y), sentence(12), fontsize=11); y += 15
+                y += 6
+            elif kind < 0.65:
+                page.insert_text((50, y), sentence(4)[:-1], fontsize=13, fontname="hebo"); y += 20
+            elif kind < 0.8:
+                numbered = rng.random() < 0.5
+                for n in range(rng.randrange(2, 5)):
+                    marker = f"{n + 1}." if numbered else "-"
+                    page.insert_text((70 + 20 * (n % 2), y), f"{marker} {sentence(8)}", fontsize=11); y += 15
+                y += 6
+            elif kind < 0.92:
+                for n in range(rng.randrange(2, 6)):
+                    page.insert_text((50, y), f"{'    ' * (n % 2)}{rng.choice(VOCAB)}_{n} = check({rng.choice(VOCAB)!r})",
+                                     fontsize=10, fontname="cour"); y += 13
+                y += 6
+            elif images:
+                page.insert_image(fitz.Rect(50, y, 170, y + 60), stream=make_image(rng, 120, 60)); y += 70
+        if i % 7 == 3:
+            # code block carried over the page break
+            page.insert_text((50, 790), "continue_on_next_page()", fontsize=10, fontname="cour")
+    if password:
+        doc.save(path, garbage=3, deflate=True, encryption=fitz.PDF_ENCRYPT_AES_256, user_pw=password, owner_pw=password)
+    else:
+        doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def corpus(directory, page_counts):
+    """Create (or reuse) the corpus files; returns [(name, path, password)]."""
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for n in page_counts:
+        for name, images, password in ((f"plain-{n}", True, None), (f"text-{n}", False, None),
+                                       (f"encrypted-{n}", True, PASSWORD)):
+            path = os.path.join(directory, name + ".pdf")
+            if not os.path.exists(path):
+                make_pdf(path, n, seed=n, images=images, password=password)
+            files.append((name, path, password))
+    return files
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS counter (Linux); False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+
+def bench_file(m, path, password, work):
+    """Run each converter stage once over `path`; returns [(stage, seconds, peak MB)]."""
+    results = []
+
+    def stage(name, fn):
+        reset_peak_rss()
+        start = time.perf_counter()
+        value = fn()
+        results.append((name, time.perf_counter() - start, peak_rss_mb()))
+        return value
+
+    doc = stage("open", lambda: m.open_pdf(path, password))
+    pages = stage("extract", lambda: [m.extract_page(page) for page in doc])
+    base_size, heading_sizes = stage("headings", lambda: m.detect_headings_style(pages))
+    level = dict(zip(heading_sizes, (3, 4)))
+    ctx = {"classifier": m.LineClassifier(level, base_size), "images": True, "tables": True,
+           "image_dir": os.path.join(work, "img"), "link_dir": work, "page_cache": None,
+           "profile": m.Profile(False), "ocr_options": m.OcrOptions()}
+
+    def render():
+        md, freq, tags, in_code = [], {}, set(), False
+        for pnum, blocks in enumerate(pages):
+            page = m.render_page(blocks, pnum, ctx)
+            for text in page["texts"]:
+                m.count_terms(text, freq)
+                m.find_tags(text, tags)
+            in_code = m.stitch_page(md, page, in_code)
+        if in_code:
+            md.append('```')
+        return md, freq
+    md, freq = stage("render", render)
+
+    def wikilinks():
+        pattern = m.link_pattern(freq)
+        return [m.link_line(line, pattern) for line in md]
+    md = stage("wikilinks", wikilinks)
+
+    def write():
+        with open(os.path.join(work, "out.md"), "w", encoding="utf-8") as f:
+            f.write('\n'.join(md))
+    stage("write", write)
+    doc.close()
+
+    def convert(stream):
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+            m.extract_pdf_to_markdown(path, password, os.path.join(work, "full.md"), stream=stream)
+    stage("total", lambda: convert(False))
+    stage("total --stream", lambda: convert(True))
+    return results
+
+
+def import_times(runs=5, top=10):
+    """Cold-start `pdf-md-scan.py --help` under -X importtime `runs` times.
+
+    Returns the median total import time in ms, the `top` slowest imports
+    (name, cumulative ms) of the last run: the top-level ones, with
+    pdf_md_scan (all the script imports) broken down into its own imports,
+    and the set of every module the last run imported."""
+    totals = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", os.path.join(HERE, "pdf-md-scan.py"), "--help"],
+                              capture_output=True, text=True, check=True)
+        imports = []
+        modules = set()
+        nested = []   # imports one level down; -X importtime lists them before their parent
+        total = 0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if not cumulative.strip().isdigit():
+                continue
+            modules.add(name.strip())
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            ms = int(cumulative) / 1000
+            if depth == 1:
+                nested.append((f"pdf_md_scan > {name.strip()}", ms))
+            elif depth == 0:
+                total += ms
+                if name.strip() == "pdf_md_scan":
+                    imports.extend(nested)
+                    imports.append(("pdf_md_scan (own code)", ms - sum(t for _, t in nested)))
+                else:
+                    imports.append((name.strip(), ms))
+                nested = []
+        totals.append(total)
+    return statistics.median(totals), sorted(imports, key=lambda item: -item[1])[:top], modules
+
+
+def ocr_images(path, pages, dpi=600):
+    """Render up to `pages` pages as 600 dpi cream-coloured RGBA PNGs; returns
+    [(png bytes, ground-truth text)]."""
+    doc = fitz.open(path)
+    images = []
+    for page in list(doc)[:pages]:
+        pix = page.get_pixmap(dpi=dpi)
+        pix.tint_with(0x101020, 0xEBE1C8)
+        images.append((fitz.Pixmap(pix, 1).tobytes("png"), page.get_text("text")))
+    return images
+
+
+def bench_ocr(m, images, repeat):
+    """OCR `images` with preprocessing off and on; prints one row per mode."""
+    from io import BytesIO
+    if not m.ocr_available():
+        print("OCR dependencies (pillow, pytesseract) are missing", file=sys.stderr)
+        return
+    tesseract = bool(m.tesseract_version())
+    if not tesseract:
+        print("note: Tesseract is not installed; timing preprocessing only", file=sys.stderr)
+    options = m.OcrOptions(True)
+    print(f"{'preprocess':<12} {'s/image':>9} {'prep s':>8} {'Mpixels':>8} {'accuracy':>9}")
+    for settings in (None, options.preprocess):
+        secs = prep = pixels = 0.0
+        scores = []
+        for data, truth in images:
+            best = best_prep = None
+            for _ in range(max(1, repeat)):
+                img = m.Image.open(BytesIO(data))
+                img.load()
+                start = time.perf_counter()
+                if settings:
+                    img = m.preprocess_for_ocr(img, *settings)
+                mid = time.perf_counter()
+                text = m.pytesseract.image_to_string(img, lang=options.lang, config=f"--psm {options.psm}") \
+                    if tesseract and img else ""
+                total = time.perf_counter() - start
+                best = total if best is None else min(best, total)
+                best_prep = mid - start if best_prep is None else min(best_prep, mid - start)
+            secs += best
+            prep += best_prep
+            pixels += img.width * img.height / 1e6 if img else 0
+            if tesseract:
+                scores.append(difflib.SequenceMatcher(None, ' '.join(truth.split()), ' '.join(text.split())).ratio())
+        accuracy = f"{100 * sum(scores) / len(scores):8.1f}%" if scores else "       -"
+        print(f"{'on' if settings else 'off':<12} {secs / len(images):9.3f} {prep / len(images):8.3f} "
+              f"{pixels / len(images):8.2f} {accuracy:>9}")
+
+
+def wikilink_lines(count, seed=0, vocabulary=5000, words=12):
+    """`count` deterministic lines of `words` random words from a synthetic vocabulary."""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocab = sorted({''.join(rng.choice(letters) for _ in range(rng.randrange(4, 11))) for _ in range(vocabulary)})
+    vocab = [w.capitalize() if i % 3 == 0 else w for i, w in enumerate(vocab)]
+    return [' '.join(rng.choice(vocab) for _ in range(words)) + '.' for _ in range(count)]
+
+
+def bench_wikilinks(m, lines, term_counts, repeat):
+    """Time linking `lines` with term_regex() against one pattern per term; prints one row per term count."""
+    freq = {}
+    for line in lines:
+        m.count_terms(line, freq)
+    print(f"{'terms':>6} {'per-term loop s':>16} {'term_regex s':>13} {'speed-up':>9}")
+    for k in term_counts:
+        terms = m.select_terms(freq, k, 1)
+        patterns = [re.compile(r"\b" + re.escape(t) + r"\b") for t in terms]
+
+        def per_term(line):   # the old link_line(): the first matching term is linked
+            for pat in patterns:
+                if pat.search(line):
+                    return pat.sub(lambda match: f"[[{match.group(0)}]]", line)
+            return line
+
+        pattern = m.term_regex(terms)
+        loop = trie = None
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            for line in lines:
+                per_term(line)
+            mid = time.perf_counter()
+            for line in lines:
+                m.link_line(line, pattern)
+            end = time.perf_counter()
+            loop = mid - start if loop is None else min(loop, mid - start)
+            trie = end - mid if trie is None else min(trie, end - mid)
+        print(f"{len(terms):>6} {loop:16.2f} {trie:13.2f} {loop / trie:8.1f}x")
+
+
+class UnixConnection(http.client.HTTPConnection):
+    """HTTP over a Unix socket (for the --serve daemon)."""
+
+    def __init__(self, socket_path):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def serve_request(socket_path, method, path, body=None, headers=None):
+    conn = UnixConnection(socket_path)
+    try:
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def percentiles(values):
+    values = sorted(values)
+    return "  ".join(f"p{q} {1000 * values[min(len(values) - 1, len(values) * q // 100)]:7.1f}ms" for q in (50, 90, 99))
+
+
+def bench_serve(files, tmp, requests, clients, workers):
+    """Cold CLI runs versus requests to a warm --serve daemon; prints one block per file."""
+    from concurrent.futures import ThreadPoolExecutor
+    sock = os.path.join(tmp, "serve.sock")
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, "pdf-md-scan.py"), "--serve", f"unix:{sock}",
+                               "--jobs", str(workers)], stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            if os.path.exists(sock):
+                break
+            time.sleep(0.05)
+        for name, path, password in files:
+            body = open(path, "rb").read()
+            headers = {"X-Password": password} if password else {}
+            cold = []
+            for _ in range(3):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, os.path.join(HERE, "pdf-md-scan.py"), path, "-o",
+                                os.path.join(tmp, "cold.md"), "--no-images"] + (["-p", password] if password else []),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+                cold.append(time.perf_counter() - start)
+
+            def one(_):
+                start = time.perf_counter()
+                status, _ = serve_request(sock, "POST", "/convert?images=0", body, headers)
+                assert status == 200, status
+                return time.perf_counter() - start
+            warm = [one(i) for i in range(requests)]
+            with ThreadPoolExecutor(clients) as pool:
+                start = time.perf_counter()
+                list(pool.map(one, range(requests)))
+                secs = time.perf_counter() - start
+            print(f"{name:<16} cold CLI     {percentiles(cold)}")
+            print(f"{name:<16} daemon       {percentiles(warm)}")
+            print(f"{name:<16} {clients} clients    {requests / secs:7.1f} req/s on {workers} workers")
+        print(json.loads(serve_request(sock, "GET", "/stats")[1]))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark pdf-md-scan.py stages on a synthetic PDF corpus.")
+    p.add_argument('--pages', default='50,500', help='comma-separated page counts of the generated PDFs')
+    p.add_argument('--corpus', default=None, help='directory for the generated PDFs (reused if present; default: temporary)')
+    p.add_argument('--repeat', type=int, default=3, help='runs per file; the fastest is reported')
+    p.add_argument('--only', default=None, help='only benchmark corpus files whose name contains this string')
+    p.add_argument('--ocr', action='store_true', help='benchmark OCR preprocessing on rendered corpus pages instead')
+    p.add_argument('--serve', action='store_true', help='benchmark the --serve daemon against cold CLI runs instead')
+    p.add_argument('--requests', type=int, default=100, help='with --serve, requests per file (default 100)')
+    p.add_argument('--clients', type=int, default=8, help='with --serve, concurrent clients (default 8)')
+    p.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='with --serve, daemon worker processes')
+    p.add_argument('--wikilinks', action='store_true', help='benchmark term_regex() against a per-term loop instead')
+    p.add_argument('--lines', type=int, default=100000, help='with --wikilinks, synthetic lines (default 100000)')
+    p.add_argument('--terms', default='20,200,500', help='with --wikilinks, comma-separated term counts')
+    p.add_argument('--import-time', action='store_true', help='measure start-up import time instead of conversion')
+    p.add_argument('--max-import-ms', type=float, default=None, help='with --import-time, fail above this median')
+    args = p.parse_args()
+
+    if args.import_time:
+        total, slowest, _ = import_times(max(1, args.repeat))
+        print(f"import time (median of {max(1, args.repeat)}): {total:.1f} ms")
+        for name, ms in slowest:
+            print(f"  {name:<32} {ms:8.1f} ms")
+        if args.max_import_ms is not None and total > args.max_import_ms:
+            print(f"import time {total:.1f} ms exceeds the {args.max_import_ms:g} ms budget", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    import pdf_md_scan as m
+    if args.wikilinks:
+        bench_wikilinks(m, wikilink_lines(args.lines), [int(n) for n in args.terms.split(',')], args.repeat)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        files = corpus(args.corpus or os.path.join(tmp, "corpus"), [int(n) for n in args.pages.split(',')])
+        if args.ocr:
+            name, path, _ = files[0]
+            bench_ocr(m, ocr_images(path, int(args.pages.split(',')[0])), args.repeat)
+            return
+        if args.serve:
+            bench_serve([f for f in files if not args.only or args.only in f[0]], tmp, args.requests, args.clients,
+                        args.jobs)
+            return
+        if not reset_peak_rss():
+            print("note: peak RSS is cumulative (cannot reset it on this platform)", file=sys.stderr)
+        print(f"{'file':<16} {'stage':<15} {'seconds':>9} {'pages/s':>10} {'MB/s':>9} {'peak RSS':>9}")
+        for name, path, password in files:
+            if args.only and args.only not in name:
+                continue
+            doc = m.open_pdf(path, password)
+            pages = doc.page_count
+            doc.close()
+            mb = os.path.getsize(path) / 2**20
+            best = {}
+            for _ in range(max(1, args.repeat)):
+                for stage, secs, rss in bench_file(m, path, password, tmp):
+                    if stage not in best or secs < best[stage][0]:
+                        best[stage] = (secs, rss)
+            for stage, (secs, rss) in best.items():
+                print(f"{name:<16} {stage:<15} {secs:9.4f} {pages / secs:10.1f} {mb / secs:9.2f} {rss:7.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
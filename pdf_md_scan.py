@@ -0,0 +1,2515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pdf_md_scan.py: Convert a password-protected PDF into structured Markdown (Obsidian-ready).
+Extracts text (with headings, lists, etc.), tables, images, and augments with wikilinks and tags.
+
+Run it as `python pdf-md-scan.py` (see main()), or import it and call
+convert() / iter_markdown() to convert in-process without touching the filesystem.
+"""
+import os
+import sys
+import re
+import glob
+import time
+import contextlib
+import functools
+import hashlib
+import heapq
+import json
+import threading
+import fitz  # PyMuPDF
+import argparse
+import concurrent.futures   # .ProcessPoolExecutor is only imported when a pool is used
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from io import BytesIO, StringIO
+
+# Optional OCR, imported by ocr_available() on first use (pytesseract pulls in numpy)
+Image = pytesseract = np = None
+
+# OCR settings of one conversion (the --ocr* flags): whether to OCR, Tesseract language and
+# page segmentation mode, preprocess_for_ocr() (target text line height in px, binarization
+# threshold) or None, and an OcrCache or None. OcrOptions() is OCR off.
+OcrOptions = namedtuple("OcrOptions", "enabled lang psm preprocess cache",
+                        defaults=(False, "eng", 3, (48, 0.15), None))
+
+# Wikilink candidates and tag keywords
+WORD_RE = re.compile(r"\b[A-Za-z][A-Za-z0-9]+\b")
+BIGRAM_RE = re.compile(r"\b(\w+) (\w+)\b")
+STOP_WORDS = frozenset(["the","and","or","of","to","a","in","is","for","on","with","this","that","by","are"])
+TAG_MAP = {"security":"#security","assessment":"#assessment","compliance":"#compliance","network":"#network","vulnerability":"#vulnerability","methodology":"#methodology"}
+
+# --pages syntax: "N", "N-M", "N-" or "-M"
+PAGE_RANGE_RE = re.compile(r'(\d*)\s*(-?)\s*(\d*)')
+
+# Line classification: list markers ("- x", "• x", "3. x", "3) x") and monospace font names
+# (base-14 fonts turn "•" into "·")
+LIST_RE = re.compile(r'^(?:[*\-•◦▪·]|(\d+)[.|)](?=\s))\s*')
+MONO_FONTS = ('Courier', 'Mono', 'Consolas')
+
+# Outline-based headings: top-level bookmarks become H3 (like the largest font size), deeper ones H4..H6;
+# the body font size (for bold/coloured H4 subheadings) comes from a sample of OUTLINE_SAMPLE_PAGES pages
+OUTLINE_TOP_LEVEL = 3
+OUTLINE_SAMPLE_PAGES = 8
+OUTLINE_KEY_RE = re.compile(r"[\W_]+")
+
+
+# Per-page cache: bump PAGE_CACHE_VERSION whenever rendering changes
+PAGE_CACHE_VERSION = 4
+XREF_RE = re.compile(r"(\d+) 0 R\b")
+IMAGE_LINK_RE = re.compile(r"^!\[\]\((.+)\)$")
+
+
+# Compact span record produced by extract_page (size is already rounded to 0.1pt)
+Span = namedtuple("Span", "text size font color bbox")
+
+# Result of convert(): the Markdown text, {image name: bytes} for the image links, and counters
+Conversion = namedtuple("Conversion", "markdown images stats")
+
+# Settings of one extract_pdf_to_markdown() run that _convert() works from: the output
+# (file, streaming, stats printing), image and link directories, and the conversion options
+ConvertOptions = namedtuple("ConvertOptions", "output_file stream show_stats image_dir link_dir images tables "
+                            "link_terms link_min_count term_capacity cache_dir font_scan headings ocr_options "
+                            "ocr_workers ocr_budget")
+
+
+# get_text("dict") flags for pages whose images are not needed
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Scanned pages (one image covering most of the page, next to no text layer) get full-page OCR,
+# rasterized at the scan's own resolution clamped to this DPI range
+SCANNED_MIN_COVER = 0.6
+SCANNED_MAX_CHARS = 20
+SCANNED_DPI = (150, 300)
+
+# Tables: pages with TABLE_MIN_RULES axis-aligned ruling lines go to page.find_tables();
+# otherwise TABLE_MIN_ROWS consecutive rows of cells (text runs split by gaps wider than
+# TABLE_GAP x the font size) whose left edges line up within TABLE_ALIGN points form a table,
+# unless the cells average over TABLE_MAX_WORDS words (multi-column prose), the first column
+# holds only list markers (a hanging-indent list), or a two-column run lacks a header row
+# (set in a font of its own, or over a column of numbers)
+TABLE_MIN_RULES = 4
+TABLE_MIN_ROWS = 3
+TABLE_GAP = 1.5
+TABLE_ALIGN = 4.0
+TABLE_MAX_WORDS = 6
+TABLE_NUMBER_RE = re.compile(r'[-+(]?[$€£]?\d[\d.,]*%?\)?')
+
+
+def extract_page(page, images=True, layout=None, tables=True):
+    """Parse a page once into text blocks (lines of Spans) and image blocks.
+
+    Image payloads are dropped as soon as the page is parsed: an image block
+    carries a `load` callable that fetches {"ext", "image"} again on demand.
+    With `images=False` the page is parsed without image blocks at all.
+    A `layout` (get_text("dict") of e.g. an OCR text page) is parsed instead of the page's own text.
+    With `tables`, detected tables become table blocks ({"type": 2, "rows"})
+    and their spans are removed from the text blocks (see page_tables).
+    """
+    blocks = []
+    flags = fitz.TEXTFLAGS_DICT if images else TEXT_FLAGS
+    # the page's image sizes, computed once for all its image blocks and dropped with them
+    sizes = functools.cache(functools.partial(page_image_sizes, page.parent, page.number))
+    if layout is None:
+        layout = page.get_text("dict", flags=flags)
+    for block in layout.get("blocks", []):
+        btype = block.get("type")
+        if btype == 0:
+            lines = []
+            for line in block.get("lines", []):
+                spans = [Span(s.get("text", ""), round(s.get("size", 0), 1), s.get("font", ""),
+                              s.get("color", 0), tuple(s.get("bbox", (0, 0, 0, 0))))
+                         for s in line.get("spans", [])]
+                if spans:
+                    lines.append(spans)
+            blocks.append({"type": 0, "lines": join_list_markers(lines)})
+        elif btype == 1:
+            bbox = tuple(block.get("bbox", (0, 0, 0, 0)))
+            blocks.append({"type": 1, "number": block.get("number", 0), "top": bbox[1],
+                           "load": functools.partial(load_image, page.parent, page.number,
+                                                     (block.get("width"), block.get("height")), bbox, sizes)})
+    if tables:
+        found = page_tables(page, blocks, ruled=layout is None)
+        if found:
+            blocks = place_tables(blocks, found)
+    return blocks
+
+
+def is_list_marker(text):
+    """True when `text` is nothing but a list marker ("1.", "-", "•")."""
+    text = text.strip()
+    m = LIST_RE.match(text + ' ')
+    return bool(text) and m is not None and m.end() > len(text)
+
+
+def join_list_markers(lines):
+    """Join a line holding only a list marker to the item text set at a hanging
+    indent on the same baseline, which PyMuPDF returns as a line of its own."""
+    out = []
+    for spans in lines:
+        prev = out[-1] if out else None
+        if (prev and is_list_marker(''.join(s.text for s in prev)) and spans[0].bbox[0] > prev[-1].bbox[2]
+                and abs(prev[-1].bbox[3] - spans[0].bbox[3]) <= spans[0].size / 2):
+            out[-1] = prev[:-1] + [prev[-1]._replace(text=prev[-1].text.rstrip() + ' ')] + spans
+        else:
+            out.append(spans)
+    return out
+
+
+def ruling_lines(page):
+    """Count the page's horizontal and vertical vector lines (rectangles count four)."""
+    n = 0
+    for path in page.get_cdrawings():
+        for item in path.get("items", ()):
+            if item[0] == "re":
+                n += 4
+            elif item[0] == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+                if abs(x0 - x1) < 1 or abs(y0 - y1) < 1:
+                    n += 1
+    return n
+
+
+def visual_rows(blocks):
+    """Group the spans of all text blocks into rows by vertical position, each
+    row a list of cells [x0, y0, x1, y1, text, font of the first span] (spans
+    joined unless separated by a gap wider than TABLE_GAP x the font size),
+    sorted top to bottom."""
+    spans = sorted((s for b in blocks if b["type"] == 0 for line in b["lines"] for s in line if s.text.strip()),
+                   key=lambda s: (s.bbox[1] + s.bbox[3]) / 2)
+    rows = []
+    for span in spans:
+        mid = (span.bbox[1] + span.bbox[3]) / 2
+        if rows and abs(mid - rows[-1][0]) <= span.size / 2:
+            rows[-1][1].append(span)
+        else:
+            rows.append((mid, [span]))
+    result = []
+    for _, row in rows:
+        cells = []
+        for span in sorted(row, key=lambda s: s.bbox[0]):
+            if cells and span.bbox[0] - cells[-1][2] <= TABLE_GAP * span.size:
+                cell = cells[-1]
+                cell[1], cell[2], cell[3] = min(cell[1], span.bbox[1]), max(cell[2], span.bbox[2]), max(cell[3], span.bbox[3])
+                cell[4] += span.text
+            else:
+                cells.append([span.bbox[0], span.bbox[1], span.bbox[2], span.bbox[3], span.text, span.font])
+        result.append(cells)
+    return result
+
+
+def aligned_tables(rows):
+    """Find tables in visual rows by clustering cell left edges (NumPy).
+
+    A table is a run of at least TABLE_MIN_ROWS consecutive multi-cell rows
+    whose cells start at two or more shared column positions (three, or two
+    under a header row), and whose first column is not just list markers.
+    Returns [(bbox, [[cell text]])]."""
+    tables = []
+    start = 0
+    while start < len(rows):
+        end = start
+        while end < len(rows) and len(rows[end]) > 1:
+            end += 1
+        if end - start >= TABLE_MIN_ROWS:
+            tables.extend(_cluster_columns(rows[start:end]))
+        start = end + 1
+    return tables
+
+
+def _cluster_columns(run):
+    words = np.array([len(cell[4].split()) for row in run for cell in row])
+    if words.mean() > TABLE_MAX_WORDS:
+        return []
+    xs = np.sort(np.array([cell[0] for row in run for cell in row]))
+    groups = np.split(xs, np.flatnonzero(np.diff(xs) > TABLE_ALIGN) + 1)
+    columns = np.array([g[0] for g in groups if len(g) * 2 >= len(run)])
+    if len(columns) < 2:
+        return []
+    # every cell must start at a column; otherwise this is ragged text, not a table
+    starts = np.array([cell[0] for row in run for cell in row])
+    index = np.searchsorted(columns, starts + TABLE_ALIGN, side='right') - 1
+    if (index < 0).any() or (starts - columns[np.maximum(index, 0)] > TABLE_ALIGN).any():
+        return []
+    out, i = [], 0
+    for row in run:
+        cells = [''] * len(columns)
+        for cell in row:
+            cells[index[i]] = (cells[index[i]] + ' ' + cell[4]).strip()
+            i += 1
+        out.append(cells)
+    markers = [row[0] for row in out if row[0]]
+    if markers and all(map(is_list_marker, markers)):
+        return []
+    if len(columns) < 3 and not _header_row(run, out):
+        return []
+    bbox = (min(c[0] for r in run for c in r), min(c[1] for r in run for c in r),
+            max(c[2] for r in run for c in r), max(c[3] for r in run for c in r))
+    return [(bbox, out)]
+
+
+def _header_row(run, out):
+    """Whether the first row of a table candidate reads as a header: every
+    column filled with words, in a font the body rows do not use or above a
+    column of numbers."""
+    if not all(out[0]) or any(TABLE_NUMBER_RE.fullmatch(cell) for cell in out[0]):
+        return False
+    if not {cell[5] for cell in run[0]} & {cell[5] for row in run[1:] for cell in row}:
+        return True
+    return any(all(TABLE_NUMBER_RE.fullmatch(row[i]) for row in out[1:]) for i in range(len(out[0])))
+
+
+def page_tables(page, blocks, ruled=True):
+    """Detect a page's tables as [(bbox, rows of cell text)].
+
+    A cheap pre-check keeps ordinary pages away from the detectors: only
+    pages with TABLE_MIN_ROWS rows split into cells go on. Of those, pages
+    with ruling lines run PyMuPDF's find_tables(), and the text outside the
+    ruled tables goes through the NumPy column clustering.
+    """
+    rows = visual_rows(blocks)
+    if sum(len(row) > 1 for row in rows) < TABLE_MIN_ROWS:
+        return []
+    tables = []
+    if ruled and ruling_lines(page) >= TABLE_MIN_RULES:
+        if hasattr(fitz, "no_recommend_layout"):
+            fitz.no_recommend_layout()   # else find_tables() prints an install hint to stdout
+        try:
+            found = page.find_tables().tables
+        except Exception:
+            found = ()
+        for tab in found:
+            rows = tab.extract()
+            if tab.header.external:
+                rows = [tab.header.names] + rows
+            if len(rows) >= 2:
+                tables.append((tuple(tab.bbox), [[cell or '' for cell in row] for row in rows]))
+        if tables:
+            rows = visual_rows(place_tables(blocks, tables))
+    if numpy_available():
+        tables.extend(aligned_tables(rows))
+    return tables
+
+
+def place_tables(blocks, tables):
+    """Remove the spans inside `tables` from the text blocks and insert a table
+    block before the first remaining block that starts below each table.
+    Text blocks that lost spans are split into one block per line, so text
+    after a table in the same block stays after it."""
+    def inside(span):
+        x, y = (span.bbox[0] + span.bbox[2]) / 2, (span.bbox[1] + span.bbox[3]) / 2
+        return any(b[0] - 1 <= x <= b[2] + 1 and b[1] - 1 <= y <= b[3] + 1 for b, _ in tables)
+
+    out = []
+    sizes = {}   # the font histogram still counts the text moved into tables
+    for block in blocks:
+        if block["type"] == 0:
+            lines = []
+            for line in block["lines"]:
+                kept = [s for s in line if not inside(s)]
+                for s in line:
+                    if not inside(s):
+                        continue
+                    sizes[s.size] = sizes.get(s.size, 0) + len(s.text)
+                if kept:
+                    lines.append(kept)
+            if sum(map(len, lines)) < sum(map(len, block["lines"])):
+                out.extend({"type": 0, "lines": [line]} for line in lines)
+                continue
+        out.append(block)
+    for bbox, rows in sorted(tables, key=lambda t: t[0][1]):
+        at = next((i for i, b in enumerate(out) if b["type"] != 2 and block_top(b) >= bbox[1]), len(out))
+        out.insert(at, {"type": 2, "rows": rows, "top": bbox[1], "sizes": sizes})
+        sizes = {}
+    return out
+
+
+def block_top(block):
+    if block["type"] == 0:
+        return min(s.bbox[1] for line in block["lines"] for s in line)
+    return block["top"]
+
+
+def table_markdown(rows):
+    """Render rows of cell text as a Markdown pipe table (first row = header)."""
+    width = max(len(row) for row in rows)
+
+    def line(row):
+        cells = [' '.join((cell or '').split()).replace('|', '\\|') for cell in row]
+        return '| ' + ' | '.join(cells + [''] * (width - len(cells))) + ' |'
+    return [line(rows[0]), '|' + ' --- |' * width] + [line(row) for row in rows[1:]]
+
+
+def page_image_sizes(doc, pnum):
+    """Map (width, height) to the xrefs of a page's image resources."""
+    sizes = {}
+    for item in doc[pnum].get_images(full=True):
+        sizes.setdefault((item[2], item[3]), set()).add(item[0])
+    return sizes
+
+
+def load_image(doc, pnum, size, bbox, sizes=None):
+    """Fetch the bytes of an image block found by extract_page, as {"ext", "image"}.
+
+    The image's xref is found by matching its pixel size against the page's
+    image resources (page.get_image_info(xrefs=True) would decode every image
+    to compare digests); `sizes` returns page_image_sizes() for the page,
+    shared by its image blocks. Inline or ambiguous images are re-read from
+    the block's area of the page instead.
+    """
+    xrefs = (sizes() if sizes else page_image_sizes(doc, pnum)).get(size, ())
+    if len(xrefs) == 1:
+        info = doc.extract_image(next(iter(xrefs)))
+        return {"ext": info.get("ext", "png"), "image": info.get("image")}
+    for block in doc[pnum].get_text("dict", flags=fitz.TEXT_PRESERVE_IMAGES, clip=bbox).get("blocks", []):
+        if block.get("type") == 1 and (block.get("width"), block.get("height")) == size:
+            return {"ext": block.get("ext", "png"), "image": block.get("image")}
+    return {}
+
+
+def scanned_dpi(page):
+    """The OCR resolution for a page that is a scan, or None for other pages.
+
+    A scan is a page with an image covering at least SCANNED_MIN_COVER of it
+    and at most SCANNED_MAX_CHARS characters of text. Images with fewer pixels
+    than points in that area (under 72 dpi) are not scans and are not located
+    at all, so ordinary pages cost one image listing.
+    """
+    area = abs(page.rect)
+    for item in page.get_images(full=True):
+        if item[2] * item[3] < SCANNED_MIN_COVER * area:
+            continue
+        try:
+            bbox = page.get_image_bbox(item) & page.rect
+        except Exception:   # image not displayed on this page
+            continue
+        if abs(bbox) >= SCANNED_MIN_COVER * area:
+            if len(page.get_text("text", flags=TEXT_FLAGS).strip()) > SCANNED_MAX_CHARS:
+                return None
+            native = item[2] * 72 / max(bbox.width, 1)
+            return min(SCANNED_DPI[1], max(SCANNED_DPI[0], round(native)))
+    return None
+
+
+def ocr_page(page, dpi, ocr_options, tables=True):
+    """Run full-page OCR on a scanned page and parse the positioned result like
+    any other page. Returns (blocks, None) or (None, error message).
+
+    The OCR'd layout is kept in the OCR cache of `ocr_options`, keyed by the
+    rendered page. PyMuPDF runs Tesseract itself here, with automatic page
+    segmentation: `ocr_options.psm` and the preprocessing only apply to images.
+    """
+    cache = ocr_options.cache
+    key = layout = None
+    if cache:
+        key = cache.key(page.get_pixmap(dpi=dpi).samples, "page", ocr_options.lang, dpi, fitz.VersionBind)
+        layout = cache.get(key)
+    if layout is not None:
+        layout = json.loads(layout)
+    else:
+        try:
+            textpage = page.get_textpage_ocr(flags=TEXT_FLAGS, language=ocr_options.lang, dpi=dpi, full=True)
+            layout = page.get_text("dict", flags=TEXT_FLAGS, textpage=textpage)
+        except Exception as e:   # Tesseract or its language data missing
+            return None, f"{type(e).__name__}: {e}"
+        if key:
+            cache.put(key, json.dumps(layout))
+    return extract_page(page, images=False, layout=layout, tables=tables), None
+
+
+def size_histogram(pages, size_counts):
+    """Add the character count per rounded font size of extracted pages to `size_counts`."""
+    for blocks in pages:
+        for block in blocks:
+            if block["type"] == 2:
+                merge_stats(size_counts, block["sizes"])
+            if block["type"] != 0:
+                continue
+            for spans in block["lines"]:
+                for span in spans:
+                    size_counts[span.size] = size_counts.get(span.size, 0) + len(span.text)
+    return size_counts
+
+
+def headings_from_histogram(size_counts):
+    """Pick the base font size (most characters) and the larger heading sizes."""
+    if not size_counts:
+        return None, []
+    base_size = max(size_counts, key=size_counts.get)
+    headings = sorted([sz for sz in size_counts if sz > base_size * 1.1], reverse=True)
+    return base_size, headings
+
+
+def detect_headings_style(pages):
+    """Scan extracted pages to determine base font size (paragraph text) and heading sizes."""
+    return headings_from_histogram(size_histogram(pages, {}))
+
+
+def stratified_order(pnums):
+    """`pnums` reordered so that every prefix is spread evenly across the document
+    (first page, middle, quarters, eighths, ...)."""
+    order, seen = [], set()
+    step = 1 << max(0, len(pnums) - 1).bit_length()
+    while step:
+        for i in range(0, len(pnums), step):
+            if i not in seen:
+                seen.add(i)
+                order.append(pnums[i])
+        step //= 2
+    return order
+
+
+def sample_histogram(pnums, size_counts, sizes_of, batch=8, min_pages=24, stable=3, tolerance=0.02, margin=0.2):
+    """Add the font sizes of a stratified sample of `pnums` to `size_counts`.
+
+    Pages are histogrammed (`sizes_of(pnum)`) `batch` at a time; sampling stops
+    once the base/heading sizes have stayed the same and the normalised
+    histogram has moved by at most `tolerance` (L1) for `stable` batches in a
+    row. If that does not happen within half of the pages, or the two most
+    common sizes are within `margin` of each other, the sample is ambiguous.
+    Returns the number of pages sampled and the pages still to be scanned
+    ([] when the sample sufficed).
+    """
+    if len(pnums) < 2 * min_pages:
+        return 0, pnums
+    order = stratified_order(pnums)
+    prev = prev_dist = None
+    streak = 0
+    scanned = 0
+    while scanned * 2 < len(order):
+        for pnum in order[scanned:scanned + batch]:
+            merge_stats(size_counts, sizes_of(pnum))
+        scanned += batch
+        if scanned < min_pages:
+            continue
+        total = sum(size_counts.values()) or 1
+        dist = {sz: n / total for sz, n in size_counts.items()}
+        result = headings_from_histogram(size_counts)
+        if prev_dist is not None and result == prev and \
+                sum(abs(dist.get(sz, 0) - prev_dist.get(sz, 0)) for sz in dist.keys() | prev_dist.keys()) <= tolerance:
+            streak += 1
+        else:
+            streak = 0
+        prev, prev_dist = result, dist
+        if streak >= stable:
+            ranked = heapq.nlargest(2, size_counts.values())
+            if len(ranked) < 2 or ranked[1] < ranked[0] * (1 - margin):
+                return scanned, []
+            break
+    done = set(order[:scanned])
+    return scanned, [pnum for pnum in pnums if pnum not in done]
+
+
+def image_name(img_data):
+    """The content-hash file name of image bytes ({"ext", "image"}), or None without bytes."""
+    data = img_data.get("image")
+    if not data:
+        return None
+    return f"{hashlib.sha256(data).hexdigest()[:24]}.{img_data.get('ext', 'png')}"
+
+
+def save_image(img_data, image_dir='.', link_dir='.', saved=None):
+    """Store image bytes under a content-hash name in `image_dir`, writing each
+    distinct image only once, and return its path relative to `link_dir` for markdown.
+    `saved` (a set) remembers the paths written so far by this conversion."""
+    name = image_name(img_data)
+    if not name:
+        return None
+    data = img_data["image"]
+    path = os.path.join(image_dir, name)
+    if saved is None or path not in saved:
+        if not os.path.exists(path):
+            try:
+                os.makedirs(image_dir, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except Exception as e:
+                print(f"Failed to save image: {e}", file=sys.stderr)
+                return None
+        if saved is not None:
+            saved.add(path)
+    return os.path.relpath(path, link_dir).replace(os.sep, '/')
+
+
+class OcrCache:
+    """Persistent OCR results keyed by a hash of the image bytes and OCR settings.
+
+    Each result is a small text file under `directory`; a hit refreshes the
+    file's mtime so that eviction, which runs when the cache grows beyond
+    `max_bytes`, removes the least recently used entries first.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(e.stat().st_size for e in self._entries())
+
+    def __reduce__(self):
+        # Sent to worker processes as its location; each process shares one instance per cache
+        return shared_ocr_cache, (self.directory, self.max_bytes)
+
+    @staticmethod
+    def key(image_bytes, *settings):
+        h = hashlib.sha256(image_bytes)
+        h.update(repr(settings).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.txt')
+
+    def _entries(self):
+        for sub in os.scandir(self.directory):
+            if sub.is_dir():
+                yield from (e for e in os.scandir(sub.path) if e.name.endswith('.txt'))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return text
+
+    def put(self, key, text):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self.lock:
+            self.size += len(text.encode('utf-8'))
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may share the directory, so re-measure from disk
+        entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in self._entries()))
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+
+    def counters(self):
+        return {"ocr_cache_hits": self.hits, "ocr_cache_misses": self.misses}
+
+
+@functools.lru_cache(maxsize=None)
+def shared_ocr_cache(directory, max_bytes):
+    """The OcrCache of this process for `directory` (an OcrCache unpickled in a worker)."""
+    return OcrCache(directory, max_bytes)
+
+
+@functools.lru_cache(maxsize=None)
+def numpy_available():
+    """Import NumPy (OCR preprocessing, table clustering); False when missing."""
+    global np
+    try:
+        import numpy as np
+    except ImportError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def ocr_available():
+    """Import the optional OCR dependencies; False when they are missing."""
+    global Image, pytesseract
+    try:
+        from PIL import Image
+        import pytesseract
+    except ImportError:
+        return False
+    numpy_available()
+    return True
+
+
+def ocr_enabled(ocr_options):
+    """True when `ocr_options` request OCR and it can run."""
+    return ocr_options.enabled and ocr_available()
+
+
+def tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return ""
+
+
+def ink_layout(gray):
+    """Locate the text in a grayscale array: the median height in pixels of its
+    text lines (runs of rows holding dark pixels) and the (left, top, right,
+    bottom) box of the dark pixels, ignoring dark scan borders (edge rows and
+    columns that are mostly dark). None for blank images."""
+    dark = gray < gray.mean() * 0.75
+    rows, cols = np.flatnonzero(dark.mean(axis=1) < 0.5), np.flatnonzero(dark.mean(axis=0) < 0.5)
+    if not rows.size or not cols.size:
+        return None
+    top, left = rows[0], cols[0]
+    dark = dark[top:rows[-1] + 1, left:cols[-1] + 1]
+    rows = dark.mean(axis=1) > 0.002
+    ys, xs = np.flatnonzero(rows), np.flatnonzero(dark.any(axis=0))
+    if not ys.size:
+        return None
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.astype(np.int8), [0]))))
+    runs = edges[1::2] - edges[::2]
+    runs = runs[runs >= 3]
+    height = int(np.median(runs)) if runs.size else 0
+    return height, (left + xs[0], top + ys[0], left + xs[-1] + 1, top + ys[-1] + 1)
+
+
+def binarize(gray, window, threshold):
+    """Adaptive (Bradley) threshold: a pixel is ink when it is more than
+    `threshold` darker than the mean of the `window` x `window` box around it.
+    The box sums come from running sums along each axis in turn."""
+    h, w = gray.shape
+    r = window // 2
+
+    def box_sum(a, axis, n):
+        c = np.cumsum(a, axis=axis, dtype=np.int32)
+        c = np.concatenate((np.zeros_like(c.take([0], axis=axis)), c), axis=axis)
+        hi, lo = np.minimum(np.arange(n) + r + 1, n), np.maximum(np.arange(n) - r, 0)
+        return c.take(hi, axis=axis) - c.take(lo, axis=axis), hi - lo
+
+    rows, row_n = box_sum(gray, 0, h)
+    total, col_n = box_sum(rows, 1, w)
+    count = row_n[:, None] * col_n[None, :]
+    return gray * (count * 100.0) < total * (100.0 - 100 * threshold)
+
+
+def preprocess_for_ocr(img, line_height, threshold):
+    """Prepare an image for Tesseract: flatten alpha onto white, grayscale,
+    crop to the text, downscale so its lines are about `line_height` px tall
+    (never upscaled; a box filter averages the dropped pixels) and binarize
+    adaptively. Returns None for blank images."""
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        flat = Image.new("L", img.size, 255)
+        flat.paste(img.convert("L"), mask=img.getchannel("A"))
+        img = flat
+    else:
+        img = img.convert("L")
+    layout = ink_layout(np.asarray(img))
+    if layout is None:
+        return None
+    height, (left, top, right, bottom) = layout
+    margin = max(height, 8)
+    img = img.crop((max(0, left - margin), max(0, top - margin), min(img.width, right + margin),
+                    min(img.height, bottom + margin)))
+    if height > line_height:
+        scale = line_height / height
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.BOX)
+    ink = binarize(np.asarray(img), 2 * line_height + 1, threshold)
+    return Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+
+
+def ocr_image_to_text(image_bytes, ocr_options):
+    """Extract text from image if `ocr_options` enable OCR, consulting their cache first.
+    The image is cleaned up by preprocess_for_ocr() unless `ocr_options.preprocess`
+    is None (or NumPy is missing)."""
+    if not ocr_enabled(ocr_options):
+        return ""
+    lang, psm, preprocess, cache = ocr_options[1:]
+    preprocess = preprocess if np is not None else None
+    key = None
+    if cache:
+        key = cache.key(image_bytes, lang, psm, tesseract_version(), preprocess)
+        text = cache.get(key)
+        if text is not None:
+            return text
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        if preprocess:
+            img = preprocess_for_ocr(img, *preprocess)
+        text = pytesseract.image_to_string(img, lang=lang, config=f"--psm {psm}").strip() if img else ""
+    except Exception:
+        return ""
+    if key:
+        cache.put(key, text)
+    return text
+
+
+def ocr_settings(ocr_options):
+    """The parts of `ocr_options` that change a conversion's output (for cache keys)."""
+    return ocr_enabled(ocr_options), ocr_options.lang, ocr_options.psm, ocr_options.preprocess
+
+
+def ocr_cache_counters(ocr_options):
+    """Current hit/miss counters of the OCR cache in `ocr_options` ({} without a cache)."""
+    return ocr_options.cache.counters() if ocr_options.cache else {}
+
+
+def merge_stats(stats, more):
+    """Add the counters in `more` to `stats`."""
+    for k, v in more.items():
+        stats[k] = stats.get(k, 0) + v
+    return stats
+
+
+def counter_delta(before, after):
+    """Counters accumulated between two snapshots."""
+    return {k: v - before.get(k, 0) for k, v in after.items()}
+
+
+class OcrJobs:
+    """Thread pool running ocr_image_to_text with one document's `ocr_options`.
+
+    Jobs are submitted as image blocks are rendered and their Futures stand in
+    for the `> OCR:` lines until resolve_ocr() fills them in. `deadline`
+    (a time.time() value, so it is valid across processes) caps the total OCR
+    time: later images are skipped and unfinished jobs are dropped. Both
+    resolve to None, which resolve_ocr() records as `ocr_skipped` on the page.
+    """
+
+    def __init__(self, workers, deadline=None, ocr_options=OcrOptions()):
+        self.workers = max(1, workers)
+        self.ocr_options = ocr_options
+        self.pool = ThreadPoolExecutor(self.workers)
+        self.deadline = deadline
+        self.skipped = 0
+        self.seconds = 0.0   # OCR time summed over the threads
+        self.lock = threading.Lock()
+
+    def submit(self, image_bytes):
+        if not image_bytes:
+            return None
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.skipped += 1
+            job = Future()
+            job.set_result(None)
+            return job
+        return self.pool.submit(self._run, image_bytes)
+
+    def _run(self, image_bytes):
+        start = time.perf_counter()
+        text = ocr_image_to_text(image_bytes, self.ocr_options)
+        with self.lock:
+            self.seconds += time.perf_counter() - start
+        return text
+
+    def result(self, job):
+        timeout = None if self.deadline is None else max(0.0, self.deadline - time.time())
+        try:
+            return job.result(timeout)
+        except TimeoutError:
+            job.cancel()
+            self.skipped += 1
+            return None
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.skipped:
+            print(f"OCR time budget exhausted; skipped {self.skipped} image(s).", file=sys.stderr)
+
+
+def resolve_ocr(page, ocr):
+    """Replace the pending OCR jobs in a rendered page with their text (in place).
+
+    A page with jobs cut by the time budget is flagged `ocr_skipped` so that
+    PageCache.put() leaves it out of the cache.
+    """
+    done = {}
+    for job in page["texts"]:
+        if isinstance(job, Future):
+            done[job] = ocr.result(job)
+    if None in done.values():
+        page["ocr_skipped"] = True
+    page["lines"] = [(f"> OCR: {done[line]}" if isinstance(line, Future) else line)
+                     for line in page["lines"] if not isinstance(line, Future) or done[line]]
+    page["texts"] = [t for t in (done[t] if isinstance(t, Future) else t for t in page["texts"]) if t]
+    return page
+
+
+def ocr_pending(page):
+    """True while any OCR job of a rendered page is still running."""
+    return any(isinstance(line, Future) and not line.done() for line in page["lines"])
+
+
+# --profile stages, in report order; nested ones are indented under their parent
+PROFILE_STAGES = (("open", 0), ("scanned", 0), ("histogram", 0), ("render", 0), ("images", 1), ("ocr", 1), ("wikilinks", 0), ("write", 0))
+NO_TIMER = contextlib.nullcontext()
+
+
+class Profile:
+    """Wall-clock seconds per conversion stage and per page (for --profile).
+
+    A disabled Profile hands out a shared no-op context manager, so the
+    timers around the hot paths cost next to nothing when profiling is off.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.times = {}
+        self.pages = {}
+
+    def stage(self, name, pnum=None):
+        return _StageTimer(self, name, pnum) if self.enabled else NO_TIMER
+
+    def add(self, name, secs, pnum=None):
+        self.times[name] = self.times.get(name, 0.0) + secs
+        if pnum is not None:
+            self.pages[pnum] = self.pages.get(pnum, 0.0) + secs
+
+    def state(self):
+        return {"times": self.times, "pages": self.pages}
+
+    def merge(self, state):
+        merge_stats(self.times, state["times"])
+        merge_stats(self.pages, state["pages"])
+
+    def report(self, wall, top=10, workers=1):
+        """Print the stage breakdown and the `top` slowest pages to stderr."""
+        print(f"Profile: {wall:.3f}s wall" + (f" (render times summed over {workers} workers)" if workers > 1 else ""),
+              file=sys.stderr)
+        for name, depth in PROFILE_STAGES:
+            if name in self.times:
+                secs = self.times[name]
+                print(f"  {'  ' * depth}{name:<{14 - 2 * depth}} {secs:9.3f}s {100 * secs / wall:6.1f}%", file=sys.stderr)
+        if self.pages and top:
+            print("Slowest pages:", file=sys.stderr)
+            for pnum, secs in heapq.nlargest(top, self.pages.items(), key=lambda item: item[1]):
+                print(f"  page {pnum + 1:<8} {secs:9.4f}s", file=sys.stderr)
+
+
+class _StageTimer:
+    __slots__ = ("profile", "name", "pnum", "start")
+
+    def __init__(self, profile, name, pnum):
+        self.profile, self.name, self.pnum = profile, name, pnum
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, time.perf_counter() - self.start, self.pnum)
+
+
+class LineClassifier:
+    """Decide whether a text line is a heading, list item, code or body text.
+
+    The font-derived part of the decision depends only on the first span's
+    (font, size, color), so it is computed once per distinct style and
+    memoized; only the list-marker test looks at each line's text. `counts`
+    tallies how many lines took each branch.
+    """
+
+    def __init__(self, level, base_size, outline=None):
+        self.level = level
+        self.base_size = base_size
+        self.outline = outline or {}
+        self.prefixes = {}   # page -> the leading words of its outline titles
+        self.styles = {}
+        self.counts = {}
+
+    def style(self, span):
+        key = (span.font, span.size, span.color)
+        style = self.styles.get(key)
+        if style is None:
+            if span.size in self.level:
+                style = ('heading', self.level[span.size])
+            elif span.size == self.base_size and ('Bold' in span.font or span.color != 0):
+                style = ('heading', 4)
+            elif any(m in span.font for m in MONO_FONTS):
+                style = ('code', None)
+            else:
+                style = ('text', None)
+            self.styles[key] = style
+        return style
+
+    def classify(self, spans, text, pnum=None):
+        """Return (kind, value): ('heading', level), ('list', (marker, content)),
+        ('code', None) or ('text', None). Lines matching an `outline` title of
+        their page are headings at the outline's level whatever their font."""
+        if self.outline:
+            titles = self.outline.get(pnum)
+            if titles:
+                level = titles.get(outline_key(text))
+                if level:
+                    self.counts['heading'] = self.counts.get('heading', 0) + 1
+                    return 'heading', level
+        kind, value = self.style(spans[0])
+        if kind != 'heading':
+            stripped = text.strip()
+            m = LIST_RE.match(stripped)
+            if m:
+                kind, value = 'list', (m.group(1) + '.' if m.group(1) else '-', stripped[m.end():])
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        return kind, value
+
+    def join_titles(self, lines, pnum):
+        """Join runs of consecutive lines that together read as an outline title
+        of page `pnum` (a bookmark title wrapped over several lines) into one line."""
+        titles = self.outline.get(pnum)
+        if not titles:
+            return lines
+        prefixes = self.prefixes.get(pnum)
+        if prefixes is None:
+            prefixes = self.prefixes[pnum] = {' '.join(key.split()[:n]) for key in titles
+                                              for n in range(1, len(key.split()))}
+        out = []
+        i = 0
+        while i < len(lines):
+            key = outline_key(''.join(s.text for s in lines[i]))
+            j = i + 1
+            while key in prefixes and key not in titles and j < len(lines):
+                key = f"{key} {outline_key(''.join(s.text for s in lines[j]))}".strip()
+                j += 1
+            if j > i + 1 and key in titles:
+                joined = [s._replace(text=s.text.rstrip() + ' ') if k == len(line) - 1 else s
+                          for line in lines[i:j - 1] for k, s in enumerate(line)]
+                out.append(joined + list(lines[j - 1]))
+                i = j
+            else:
+                out.append(lines[i])
+                i += 1
+        return out
+
+    def counters(self):
+        stats = {f"lines_{kind}": n for kind, n in self.counts.items()}
+        stats["line_styles_computed"] = len(self.styles)
+        return stats
+
+
+def outline_key(text):
+    """Normalise a heading for matching against outline titles."""
+    return OUTLINE_KEY_RE.sub(' ', text).strip().casefold()
+
+
+def outline_headings(doc):
+    """Map page number -> {normalised title: heading level} from the PDF's
+    bookmark outline ({} when it has none)."""
+    outline = {}
+    for lvl, title, page in doc.get_toc(simple=True):
+        key = outline_key(title)
+        if page >= 1 and key:
+            outline.setdefault(page - 1, {}).setdefault(key, min(6, OUTLINE_TOP_LEVEL + lvl - 1))
+    return outline
+
+
+def render_page(blocks, pnum, ctx, ocr=None):
+    """Render one extracted page to Markdown lines.
+
+    `ctx` holds the document-wide settings: the LineClassifier, whether to
+    emit `images` and `tables`, and where they go (`image_dir`, links relative to `link_dir`,
+    or with an `image_store` dict, kept in memory under their bare names), the
+    `saved_images` set of save_image() and the conversion's `ocr_options`.
+    The page is rendered as if no code block were open when it starts; the
+    caller joins pages with stitch_page(). Images are OCR'd through `ocr`
+    (an OcrJobs) when given, leaving Futures to be filled by resolve_ocr().
+    Returns a dict with the Markdown `lines`, the `texts` used for link/tag
+    analysis, and whether the page opens with (`lead_code`) or leaves open
+    (`end_code`) a code block.
+    """
+    classify = ctx["classifier"].classify
+    join_titles = ctx["classifier"].join_titles
+    profile = ctx["profile"]
+    md = []          # markdown lines
+    collected = []   # textual content for link/tag analysis
+    in_code = False
+    lead_code = False
+
+    for block in blocks:
+        btype = block["type"]
+        # Text blocks
+        if btype == 0:
+            for spans in join_titles(block["lines"], pnum):
+                text = ''.join(s.text for s in spans)
+                kind, value = classify(spans, text, pnum)
+
+                # Headings
+                if kind == 'heading':
+                    if in_code:
+                        md.append('```')
+                        in_code = False
+                    md.append(f"{'#'*value} {text.strip()}")
+                    collected.append(text.strip())
+                    continue
+
+                # Lists
+                if kind == 'list':
+                    if in_code:
+                        md.append('```')
+                        in_code=False
+                    marker, content = value
+                    indent = int(spans[0].bbox[0] // 20)
+                    md.append(' '*(4*indent)+f"{marker} {content}")
+                    collected.append(content)
+                    continue
+
+                # Code (monospace font)
+                if kind == 'code':
+                    if not in_code:
+                        if not md:
+                            lead_code = True
+                        md.append('```')
+                        in_code=True
+                    md.append(text.rstrip())
+                    continue
+                if in_code:
+                    md.append('```')
+                    in_code=False
+
+                # Normal text
+                md.append(text.rstrip())
+                collected.append(text.rstrip())
+
+        # Image blocks
+        elif btype == 1:
+            with profile.stage("images"):
+                block = block["load"]()
+                store = ctx.get("image_store")
+                if store is None:
+                    img = save_image(block, ctx["image_dir"], ctx["link_dir"], ctx.get("saved_images"))
+                else:
+                    img = image_name(block)
+                    if img:
+                        store[img] = block["image"]
+            if img:
+                if in_code:
+                    md.append('```'); in_code=False
+                md.append(f"![]({img})")
+                if ocr:
+                    job = ocr.submit(block.get('image'))
+                    if job:
+                        md.append(job)
+                        collected.append(job)
+                    continue
+                ocrtxt = ocr_image_to_text(block.get('image'), ctx["ocr_options"])
+                if ocrtxt:
+                    md.append(f"> OCR: {ocrtxt}")
+                    collected.append(ocrtxt)
+
+        # Table blocks: blank lines keep surrounding text out of the table
+        elif btype == 2:
+            if in_code:
+                md.append('```'); in_code=False
+            md.append('')
+            md.extend(table_markdown(block["rows"]))
+            md.append('')
+            collected.extend(cell for row in block["rows"] for cell in row if cell)
+    return {"lines": md, "texts": collected, "lead_code": lead_code, "end_code": in_code}
+
+
+def stitch_page(out, page, in_code):
+    """Append a rendered page to `out`, continuing or closing a code block left
+    open by the previous page. Returns the code-block state after the page."""
+    lines = page["lines"]
+    if not lines:
+        return in_code
+    if in_code:
+        if page["lead_code"]:
+            lines = lines[1:]   # code carries on across the page break
+        else:
+            out.append('```')
+    out.extend(lines)
+    return page["end_code"]
+
+
+class PageCache:
+    """On-disk cache of per-page results for re-issued documents.
+
+    A page's fingerprint hashes its content streams, geometry and every
+    object reachable from its resources (fonts, images, form XObjects).
+    The font-size histogram of a page is cached under the fingerprint alone;
+    rendered Markdown under the fingerprint plus everything rendering
+    depends on (heading levels, image and OCR settings). Unchanged pages of
+    a revised PDF are then spliced in without being parsed at all.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._xrefs = {}   # xref -> (digest, referenced xrefs), shared by the pages of a document
+        self._fps = {}     # page number -> fingerprint
+        os.makedirs(directory, exist_ok=True)
+
+    def fingerprint(self, doc, pnum):
+        fp = self._fps.get(pnum)
+        if fp is None:
+            page = doc[pnum]
+            h = hashlib.sha256(repr((tuple(page.rect), page.rotation)).encode())
+            for xref in page.get_contents():
+                h.update(doc.xref_stream_raw(xref) or b'')
+            resources = page_resources(doc, page)
+            h.update(resources.encode())
+            stack, seen = [int(x) for x in XREF_RE.findall(resources)], set()
+            while stack:
+                xref = stack.pop()
+                if xref in seen:
+                    continue
+                seen.add(xref)
+                if xref not in self._xrefs:
+                    obj = doc.xref_object(xref, compressed=True)
+                    d = hashlib.sha256(obj.encode())
+                    if doc.xref_is_stream(xref):
+                        d.update(doc.xref_stream_raw(xref) or b'')
+                    self._xrefs[xref] = (d.digest(), [int(x) for x in XREF_RE.findall(obj)])
+                digest, refs = self._xrefs[xref]
+                h.update(digest)
+                stack.extend(refs)
+            fp = self._fps[pnum] = h.hexdigest()
+        return fp
+
+    def render_key(self, fp, ctx, pnum):
+        classifier = ctx["classifier"]
+        settings = (PAGE_CACHE_VERSION, fp, sorted(classifier.level.items()), classifier.base_size,
+                    sorted(classifier.outline.get(pnum, {}).items()),
+                    ctx["images"], ctx["tables"], ctx["image_dir"], ctx["link_dir"], ocr_settings(ctx["ocr_options"]),
+                    pnum in ctx.get("scanned", {}))
+        return hashlib.sha256(repr(settings).encode()).hexdigest()
+
+    def _load(self, name):
+        try:
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, name, value):
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def histogram(self, fp):
+        counts = self._load(f"{fp}.sizes.json")
+        return {float(sz): n for sz, n in counts.items()} if counts is not None else None
+
+    def put_histogram(self, fp, counts):
+        self._store(f"{fp}.sizes.json", {str(sz): n for sz, n in counts.items()})
+
+    def get(self, key, link_dir):
+        page = self._load(f"{key}.page.json")
+        # A hit is only usable while the images it links to are still there
+        if page is not None and all(os.path.exists(os.path.join(link_dir, m.group(1)))
+                                    for m in map(IMAGE_LINK_RE.match, page["lines"]) if m):
+            self.hits += 1
+            return page
+        self.misses += 1
+        return None
+
+    def put(self, page):
+        key = page.pop("cache_key", None)
+        if key and not page.get("ocr_skipped"):
+            self._store(f"{key}.page.json", {k: page[k] for k in ("lines", "texts", "lead_code", "end_code")})
+
+    def counters(self):
+        return {"page_cache_hits": self.hits, "page_cache_misses": self.misses}
+
+
+def page_resources(doc, page):
+    """The page's /Resources entry as PDF source, following inheritance from parent nodes."""
+    xref = page.xref
+    while True:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != 'null':
+            return doc.xref_object(int(value.split()[0]), compressed=True) if kind == 'xref' else value
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        if kind != 'xref':
+            return ''
+        xref = int(parent.split()[0])
+
+
+def page_sizes(doc, pnum, cache=None, keep=None, images=True, tables=True):
+    """Font-size histogram of one page, from `cache` when possible.
+
+    Parsed pages are stored in `keep` (a dict) when given, so the render pass
+    can reuse them; otherwise the page is parsed without image blocks or tables.
+    """
+    fp = cache.fingerprint(doc, pnum) if cache else None
+    counts = cache.histogram(fp) if cache else None
+    if counts is None:
+        blocks = extract_page(doc[pnum], images=images and keep is not None, tables=tables and keep is not None)
+        if keep is not None:
+            keep[pnum] = blocks
+        counts = size_histogram([blocks], {})
+        if cache:
+            cache.put_histogram(fp, counts)
+    return counts
+
+
+def render_cached(doc, pnum, ctx, ocr=None, blocks=None):
+    """render_page() for page `pnum`, or its cached result when ctx has a page cache.
+
+    Freshly rendered pages carry a `cache_key`; PageCache.put() stores them
+    once their OCR has been resolved.
+    """
+    with ctx["profile"].stage("render", pnum):
+        return _render_cached(doc, pnum, ctx, ocr, blocks)
+
+
+def _render_cached(doc, pnum, ctx, ocr, blocks):
+    cache = ctx.get("page_cache")
+    key = None
+    if cache:
+        key = cache.render_key(cache.fingerprint(doc, pnum), ctx, pnum)
+        page = cache.get(key, ctx["link_dir"])
+        if page is not None:
+            return page
+    if blocks is None:
+        blocks = ctx.get("scanned", {}).get(pnum)
+    if blocks is None:
+        blocks = extract_page(doc[pnum], ctx["images"], tables=ctx["tables"])
+    page = render_page(blocks, pnum, ctx, ocr)
+    if key:
+        page["cache_key"] = key
+    return page
+
+
+def render_pages(doc, pnums, ctx, ocr=None):
+    """Render a run of pages and stitch them into a single page-like result."""
+    out = {"lines": [], "texts": [], "lead_code": False, "end_code": False}
+    pages = [render_cached(doc, pnum, ctx, ocr) for pnum in pnums]
+    for page in pages:
+        if ocr:
+            resolve_ocr(page, ocr)
+        if ctx.get("page_cache"):
+            ctx["page_cache"].put(page)
+        if page["lines"] and not out["lines"]:
+            out["lead_code"] = page["lead_code"]
+        out["end_code"] = stitch_page(out["lines"], page, out["end_code"])
+        out["texts"].extend(page["texts"])
+    return out
+
+
+def open_document(source, password=None):
+    """Open and authenticate a PDF given as a path, bytes or a binary file object.
+    Raises ValueError for a wrong or missing password (and PyMuPDF's errors for bad files)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        doc = fitz.open(stream=bytes(source), filetype="pdf")
+    elif hasattr(source, "read"):
+        doc = fitz.open(stream=source.read(), filetype="pdf")
+    else:
+        doc = fitz.open(source)
+    if doc.needs_pass and (not password or not doc.authenticate(password)):
+        doc.close()
+        raise ValueError("Invalid or missing PDF password.")
+    return doc
+
+
+def open_pdf(pdf_path, password=None):
+    """Open and authenticate a PDF. Returns None (after reporting why) on failure."""
+    try:
+        return open_document(pdf_path, password)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+    except Exception as e:
+        print(f"Error opening PDF: {e}", file=sys.stderr)
+    return None
+
+
+def parse_page_ranges(spec, page_count):
+    """Turn a 1-based page selection such as "1-20,150,400-" into a sorted
+    list of 0-based page numbers. Raises ValueError for malformed specs."""
+    if spec is None:
+        return list(range(page_count))
+    selected = set()
+    for part in spec.split(','):
+        part = part.strip()
+        m = PAGE_RANGE_RE.fullmatch(part)
+        if not part or not m or not (m.group(1) or m.group(3)) or (m.group(3) and not m.group(2)):
+            raise ValueError(f"bad page range {part!r}")
+        first = int(m.group(1)) if m.group(1) else 1
+        last = int(m.group(3)) if m.group(3) else (page_count if m.group(2) else first)
+        if first < 1 or last < first and m.group(3):
+            raise ValueError(f"bad page range {part!r}")
+        selected.update(range(first - 1, min(last, page_count)))
+    if not selected:
+        raise ValueError(f"no pages selected by {spec!r} (the document has {page_count})")
+    return sorted(selected)
+
+
+def page_chunks(pnums, workers):
+    """Split the selected pages into runs of consecutive pages, a few per worker
+    for load balancing."""
+    size = max(1, -(-len(pnums) // (workers * 4)))
+    chunks = []
+    for pnum in pnums:
+        if not chunks or pnum != chunks[-1][-1] + 1 or len(chunks[-1]) == size:
+            chunks.append([])
+        chunks[-1].append(pnum)
+    return chunks
+
+
+# Process-pool workers: fitz.Document cannot be shared, so each task reopens the PDF
+def _scan_chunk(task):
+    pdf_path, password, pnums, cache_dir = task
+    doc = open_pdf(pdf_path, password)
+    cache = PageCache(cache_dir) if cache_dir else None
+    size_counts = {}
+    for pnum in pnums:
+        merge_stats(size_counts, page_sizes(doc, pnum, cache))
+    return size_counts
+
+
+def _render_chunk(task):
+    pdf_path, password, pnums, ctx, ocr_workers, ocr_deadline = task
+    doc = open_pdf(pdf_path, password)
+    ocr_options = ctx["ocr_options"]
+    ocr = OcrJobs(ocr_workers, ocr_deadline, ocr_options) if ocr_enabled(ocr_options) else None
+    before = ocr_cache_counters(ocr_options)
+    try:
+        out = render_pages(doc, pnums, ctx, ocr)
+        out["stats"] = merge_stats(counter_delta(before, ocr_cache_counters(ocr_options)), ctx["classifier"].counters())
+        if ctx.get("page_cache"):
+            merge_stats(out["stats"], ctx["page_cache"].counters())
+        if ocr:
+            ctx["profile"].add("ocr", ocr.seconds)
+        out["profile"] = ctx["profile"].state()
+        return out
+    finally:
+        if ocr:
+            ocr.close()
+
+
+def mp_context(preload=()):
+    """The multiprocessing context for worker processes: a fork server (with
+    this module and `preload` imported) where there is one, else spawn.
+
+    Conversions may run in threads of a library caller or of --serve, and a
+    process forked from a threaded one can deadlock on a lock that another
+    thread held at fork time.
+    """
+    import multiprocessing   # only worker processes need it
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp = multiprocessing.get_context("forkserver")
+        mp.set_forkserver_preload([__name__, *preload])
+        return mp
+    return multiprocessing.get_context("spawn")
+
+
+def process_pool(workers):
+    """A ProcessPoolExecutor of `workers` processes started from mp_context()."""
+    return concurrent.futures.ProcessPoolExecutor(workers, mp_context=mp_context())
+
+
+def _ocr_scanned(task):
+    pdf_path, password, pnum, dpi, ocr_options, tables, deadline = task
+    if deadline is not None and time.time() >= deadline:
+        return pnum, None, None
+    return pnum, *ocr_page(open_pdf(pdf_path, password)[pnum], dpi, ocr_options, tables)
+
+
+def ocr_scanned_pages(doc, pnums, pdf_path, password, pool, workers, stats, ocr_options, tables=True, deadline=None):
+    """Find the scanned pages among `pnums` and OCR them, in parallel when
+    there are several (in `pool`, or in up to `workers` processes of their own).
+    Pages not started by `deadline` (a time.time() value) are skipped.
+    Returns ({pnum: blocks} for the pages that were OCR'd, OCR error messages)."""
+    todo = [(pdf_path, password, pnum, dpi, ocr_options, tables, deadline)
+            for pnum, dpi in ((p, scanned_dpi(doc[p])) for p in pnums) if dpi]
+    if not todo:
+        return {}, []
+    own_pool = None
+    if len(todo) == 1 or (not pool and workers <= 1):
+        results = ((pnum, None, None) if deadline is not None and time.time() >= deadline
+                   else (pnum,) + ocr_page(doc[pnum], dpi, ocr_options, tables)
+                   for _, _, pnum, dpi, _, _, _ in todo)
+    else:
+        if not pool:
+            pool = own_pool = process_pool(min(workers, len(todo)))
+        results = pool.map(_ocr_scanned, todo)
+    scanned = {}
+    errors = []
+    skipped = 0
+    try:
+        for pnum, blocks, error in results:
+            if error:
+                errors.append(error)
+            elif blocks is None:
+                skipped += 1
+            else:
+                scanned[pnum] = blocks
+    finally:
+        if own_pool:
+            own_pool.shutdown()
+    stats["scanned_pages"] = len(todo)
+    if skipped:
+        stats["scanned_ocr_skipped"] = skipped
+    if errors:
+        stats["scanned_ocr_failed"] = len(errors)
+    return scanned, errors
+
+
+def _resolved_in_order(pages, ocr, lookahead):
+    """Yield rendered pages in order with OCR filled in, letting up to
+    `lookahead` later pages render while earlier OCR jobs are still running."""
+    pending = deque()
+    for page in pages:
+        pending.append(page)
+        while pending and (len(pending) > lookahead or not ocr_pending(pending[0])):
+            yield resolve_ocr(pending.popleft(), ocr)
+    while pending:
+        yield resolve_ocr(pending.popleft(), ocr)
+
+
+def count_terms(text, freq):
+    """Add the candidate wikilink words and bigrams of `text` to `freq`."""
+    for w in WORD_RE.findall(text):
+        if len(w)<4 or w.lower() in STOP_WORDS: continue
+        freq[w] = freq.get(w,0)+1
+    for a,b in BIGRAM_RE.findall(text):
+        if len(a)>=4 and len(b)>=4 and a.lower() not in STOP_WORDS and b.lower() not in STOP_WORDS:
+            phrase=f"{a} {b}"
+            freq[phrase]=freq.get(phrase,0)+1
+
+
+def find_tags(text, tags):
+    """Add the #tags whose keyword occurs in `text` to `tags`."""
+    low=text.lower()
+    for k,tag in TAG_MAP.items():
+        if k in low:
+            tags.add(tag)
+
+
+def prune_terms(freq, capacity):
+    """Bound the term counter: once it holds over 2 x `capacity` entries, keep
+    only the `capacity` most frequent (heavy hitters survive, rare terms go)."""
+    if len(freq) > 2 * capacity:
+        keep = heapq.nlargest(capacity, freq.items(), key=lambda item: item[1])
+        freq.clear()
+        freq.update(keep)
+
+
+def select_terms(freq, k=20, min_count=2):
+    """The `k` most frequent terms seen at least `min_count` times (ties: first seen)."""
+    return [t for t, c in heapq.nlargest(k, freq.items(), key=lambda item: item[1]) if c >= min_count]
+
+
+def link_pattern(freq, k=20, min_count=2):
+    """Compile one matcher for the terms that are frequent enough to become wikilinks."""
+    return term_regex(select_terms(freq, k, min_count))
+
+
+def term_regex(terms):
+    """Build a single regex matching any of `terms` as whole words (None if empty).
+
+    The alternation is laid out as a prefix trie ("Acc(?:ess(?: Control)?|ount)")
+    so each position of a line is tested once per character rather than once
+    per term, and the longest term starting at a position wins.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def pattern(node):
+        alts = [re.escape(ch) + pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        return f"(?:{body})?" if '' in node else body
+
+    return re.compile(r"\b" + pattern(trie) + r"\b") if trie else None
+
+
+def link_line(line, pattern):
+    """Wrap every term occurrence in a Markdown line in [[wikilinks]], in one scan.
+    Code fences, OCR text and image links (whose paths may contain terms) are left alone."""
+    if pattern is None or line.startswith('```') or line.startswith('> OCR') or IMAGE_LINK_RE.match(line):
+        return line
+    return pattern.sub(r"[[\g<0>]]", line)
+
+
+def heading_source(doc, todo, size_counts, stats, headings="fonts", font_scan="full", sizes_of=None):
+    """Decide where headings come from before the font histogram is built.
+
+    With `headings="outline"` and a PDF outline, only OUTLINE_SAMPLE_PAGES
+    pages are histogrammed (for the body size); with `font_scan="sample"` a
+    converging sample is added to `size_counts`
+    (histogramming pages with `sizes_of(pnum)`). Records the choice in
+    `stats` and returns (outline, pages still to histogram).
+    """
+    outline = outline_headings(doc) if headings == "outline" else {}
+    if outline:
+        # The outline gives the heading structure; a few pages give the body size
+        for pnum in stratified_order(todo)[:OUTLINE_SAMPLE_PAGES]:
+            merge_stats(size_counts, sizes_of(pnum))
+        stats["font_scan_pages"] = min(len(todo), OUTLINE_SAMPLE_PAGES)
+        todo = []
+        stats["outline_pages"] = len(outline)
+    stats["headings"] = "outline" if outline else "fonts"
+    if font_scan == "sample" and todo:
+        sampled, todo = sample_histogram(todo, size_counts, sizes_of)
+        stats["font_scan"] = "sample" if not todo else "sample+full" if sampled else "full"
+        stats["font_scan_pages"] = sampled + len(todo)
+    return outline, todo
+
+
+def heading_classifier(size_counts, outline=None):
+    """A LineClassifier for the font histogram: the two largest sizes above body text become H3/H4.
+    With an `outline` the bookmarks give the levels, and the histogram just the body size."""
+    base_size, heading_sizes = headings_from_histogram(size_counts)
+    level = {} if outline else dict(zip(heading_sizes, (3, 4)))
+    return LineClassifier(level, base_size, outline)
+
+
+def iter_markdown(source, password=None, pages=None, images=True, tables=True, headings="fonts",
+                  font_scan="full", stats=None, image_store=None, ocr_options=OcrOptions()):
+    """Convert a PDF in-process, yielding its Markdown page by page.
+
+    `source` is a path, the PDF's bytes or a binary file object. Nothing is
+    written or printed: image payloads go into `image_store` (a dict of
+    content-hash name -> bytes, matching the `![](name)` links) when given,
+    and conversion counters into `stats` (a dict) when given. Each selected
+    page yields one string, '' for pages without text; join the non-empty
+    ones with newlines for the document. A code block still open at the end
+    is closed in the last page's string. Pages are yielded without wikilinks
+    and tags, which need the whole document
+    (see convert()). With `ocr_options` images and scanned pages are OCR'd
+    in the calling thread.
+
+    Raises ValueError for a bad password or page selection, and PyMuPDF's
+    errors for files that are not PDFs.
+    """
+    for lines, _ in _iter_pages(source, password, pages, images, tables, headings, font_scan, stats, image_store,
+                                ocr_options):
+        yield '\n'.join(lines)
+
+
+def _iter_pages(source, password, pages, images, tables, headings, font_scan, stats, image_store, ocr_options):
+    """iter_markdown() as (Markdown lines, texts for link/tag analysis) per page."""
+    doc = open_document(source, password)
+    try:
+        pnums = parse_page_ranges(pages, doc.page_count)
+        stats = {} if stats is None else stats
+        stats["pages"] = len(pnums)
+        cache_before = ocr_cache_counters(ocr_options)
+        parsed = {}
+        size_counts = {}
+        todo = pnums
+        if ocr_enabled(ocr_options):
+            # scanned pages are OCR'd up front, serially, as extract_pdf_to_markdown() does with one OCR worker
+            parsed, _ = ocr_scanned_pages(doc, pnums, None, password, None, 1, stats, ocr_options, tables)
+            size_histogram(parsed.values(), size_counts)
+            todo = [pnum for pnum in pnums if pnum not in parsed]
+        scanned = len(parsed)
+        outline, todo = heading_source(doc, todo, size_counts, stats, headings, font_scan,
+                                       lambda pnum: page_sizes(doc, pnum, None, parsed, images, tables))
+        if "font_scan_pages" in stats:
+            stats["font_scan_pages"] += scanned
+        for pnum in todo:
+            parsed[pnum] = extract_page(doc[pnum], images, tables=tables)
+        size_histogram((parsed[pnum] for pnum in todo), size_counts)
+        ctx = {"classifier": heading_classifier(size_counts, outline), "images": images, "tables": tables,
+               "image_dir": None, "link_dir": None, "image_store": {} if image_store is None else image_store,
+               "page_cache": None, "profile": Profile(False), "ocr_options": ocr_options}
+
+        in_code = False
+        prev = None
+        for pnum in pnums:
+            blocks = parsed.pop(pnum, None)
+            if blocks is None:
+                blocks = extract_page(doc[pnum], images, tables=tables)
+            md = []
+            if in_code and prev is not None and pnum != prev + 1:
+                md.append('```')
+                in_code = False
+            page = render_page(blocks, pnum, ctx)
+            in_code = stitch_page(md, page, in_code)
+            prev = pnum
+            if in_code and pnum == pnums[-1]:
+                md.append('```')
+            yield md, page["texts"]
+        merge_stats(stats, ctx["classifier"].counters())
+        merge_stats(stats, counter_delta(cache_before, ocr_cache_counters(ocr_options)))
+    finally:
+        doc.close()
+
+
+def convert(source, password=None, pages=None, images=True, tables=True, headings="fonts", font_scan="full",
+            link_terms=20, link_min_count=2, term_capacity=100000, ocr_options=OcrOptions()):
+    """Convert a PDF in-process to a Conversion(markdown, images, stats).
+
+    Takes the same `source` as iter_markdown() and the same options as
+    extract_pdf_to_markdown(), but touches neither the filesystem nor
+    stdout/stderr: images are returned as {name: bytes}, linked as
+    `![](name)`, and counters as a dict.
+    """
+    stats = {}
+    store = {}
+    md = []
+    freq = {}
+    tags = set()
+    for lines, texts in _iter_pages(source, password, pages, images, tables, headings, font_scan, stats, store,
+                                    ocr_options):
+        md.extend(lines)
+        for text in texts:
+            count_terms(text, freq)
+            find_tags(text, tags)
+        prune_terms(freq, term_capacity)
+    pattern = link_pattern(freq, link_terms, link_min_count)
+    md = [link_line(line, pattern) for line in md]
+    if tags:
+        md.append('\n' + ' '.join(sorted(tags)))
+    return Conversion('\n'.join(md), store, stats)
+
+
+def extract_pdf_to_markdown(pdf_path, password=None, output_file="output.md", stream=False, workers=1,
+                            ocr_workers=os.cpu_count() or 1, ocr_budget=None, show_stats=False,
+                            image_dir=None, images=True, tables=True, link_terms=20, link_min_count=2,
+                            term_capacity=100000, cache_dir=None, profile=False, profile_pages=10,
+                            pages=None, font_scan="full", headings="fonts", ocr_options=OcrOptions()):  # noqa: C901
+    """Convert `pdf_path` to Markdown in `output_file`.
+
+    OCR is configured per call by `ocr_options` (an OcrOptions; off by
+    default), so conversions with different settings can run concurrently
+    in threads of one process.
+
+    With `stream=True` each page is written to disk as soon as it is rendered
+    and wikilinks are added in a second pass over the written file, so memory
+    use is bounded by one page rather than the whole document.
+
+    With `workers > 1` pages are split into chunks that are analysed and
+    rendered by a process pool, then stitched back together in page order.
+
+    When OCR is on, images are OCR'd by `ocr_workers` threads while rendering
+    continues; `ocr_budget` limits the wall-clock seconds of the OCR phase per
+    document, which starts once the document has been analysed (opening it and
+    the font histogram do not count).
+    Scanned pages (a full-page image and no text layer) are OCR'd as whole
+    pages instead, in parallel, and their positioned text goes through the
+    usual heading/list/code rules in place of the image.
+
+    Images are stored once per distinct content in `image_dir` (default: the
+    directory of `output_file`) and linked relative to the output file;
+    `images=False` skips images entirely. Image bytes are only read for
+    images that are actually saved.
+
+    Tables become Markdown pipe tables (`tables=False` leaves their cells as
+    text lines): ruled tables are found by PyMuPDF's find_tables(), unruled
+    ones by lining up the columns of consecutive rows (see page_tables).
+
+    The `link_terms` most frequent words and bigrams seen at least
+    `link_min_count` times become [[wikilinks]]; the term counter keeps at
+    most about 2 x `term_capacity` entries however large the document is.
+
+    `cache_dir` enables the per-page cache (PageCache): pages whose content
+    is unchanged since an earlier run are not parsed or rendered again.
+
+    `pages` restricts the conversion (font analysis included) to a 1-based
+    page selection such as "1-20,150,400-"; a code block open at the end of
+    one range is closed before the next.
+
+    With `font_scan="sample"` the font-size histogram is built from a
+    stratified sample of pages that stops once it has converged, falling
+    back to scanning every page when the sample is ambiguous (see
+    sample_histogram); the choice is reported in the stats.
+
+    With `headings="outline"` headings come from the PDF's bookmarks
+    (doc.get_toc()) instead of font sizes: lines matching a bookmark title on
+    its target page become H3 for top-level entries down to H6, and the font
+    histogram is skipped. PDFs without bookmarks fall back to font sizes.
+
+    `show_stats` prints the conversion counters to stderr at the end;
+    `profile` prints the time spent in each stage and the `profile_pages`
+    slowest pages.
+    """
+    start = time.perf_counter()
+    prof = Profile(profile)
+    with prof.stage("open"):
+        doc = open_pdf(pdf_path, password)
+    if doc is None:
+        return False
+    try:
+        pnums = parse_page_ranges(pages, doc.page_count)
+    except ValueError as e:
+        print(f"Invalid --pages: {e}", file=sys.stderr)
+        return False
+
+    workers = max(1, min(workers, len(pnums)))
+    pool = process_pool(workers) if workers > 1 else None
+    ocr = OcrJobs(ocr_workers, None, ocr_options) if ocr_enabled(ocr_options) and not pool else None
+    try:
+        link_dir = os.path.dirname(output_file) or '.'
+        opts = ConvertOptions(output_file=output_file, stream=stream, show_stats=show_stats,
+                              image_dir=image_dir or link_dir, link_dir=link_dir, images=images, tables=tables,
+                              link_terms=link_terms, link_min_count=link_min_count, term_capacity=term_capacity,
+                              cache_dir=cache_dir, font_scan=font_scan, headings=headings, ocr_options=ocr_options,
+                              ocr_workers=ocr_workers, ocr_budget=ocr_budget)
+        ok = _convert(doc, pnums, pdf_path, password, pool=pool, workers=workers, ocr=ocr, prof=prof, opts=opts)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if ocr:
+            ocr.close()
+            prof.add("ocr", ocr.seconds)
+    if ok and profile:
+        prof.report(time.perf_counter() - start, profile_pages, workers)
+    return ok
+
+
+def _convert(doc, pnums, pdf_path, password, pool, workers, ocr, prof, opts):  # noqa: C901
+    """Convert the pages `pnums` of the open `doc` as set out by `opts` (a
+    ConvertOptions); extract_pdf_to_markdown() opens and closes everything."""
+    stats = {"pages": len(pnums)}
+    cache_before = ocr_cache_counters(opts.ocr_options)
+    chunks = page_chunks(pnums, workers) if pool else None
+    page_cache = PageCache(opts.cache_dir) if opts.cache_dir else None
+    # In memory mode parsed pages are kept for rendering; otherwise nothing per page is kept
+    pages = None if pool or opts.stream else {}
+    size_counts = {}
+    scanned = {}
+    ocr_budget = opts.ocr_budget
+    if ocr_enabled(opts.ocr_options):
+        # Scanned pages are OCR'd up front so their text counts towards the font histogram.
+        # The OCR budget covers this pass and the image OCR while rendering, not the analysis between them.
+        ocr_start = time.time()
+        with prof.stage("scanned"):
+            scanned, errors = ocr_scanned_pages(doc, pnums, pdf_path, password, pool, opts.ocr_workers, stats,
+                                                opts.ocr_options, opts.tables,
+                                                None if ocr_budget is None else ocr_start + ocr_budget)
+        if "scanned_ocr_skipped" in stats:
+            print(f"OCR time budget exhausted; skipped {stats['scanned_ocr_skipped']} scanned page(s).",
+                  file=sys.stderr)
+        if errors:
+            print(f"Full-page OCR failed for {len(errors)} scanned page(s), using their images instead: {errors[0]}",
+                  file=sys.stderr)
+        if ocr_budget is not None:
+            ocr_budget = max(0.0, ocr_budget - (time.time() - ocr_start))
+        size_histogram(scanned.values(), size_counts)
+    todo = [pnum for pnum in pnums if pnum not in scanned] if scanned else pnums
+    with prof.stage("histogram"):
+        outline, todo = heading_source(doc, todo, size_counts, stats, opts.headings, opts.font_scan,
+                                       lambda pnum: page_sizes(doc, pnum, page_cache, pages, opts.images, opts.tables))
+    if "font_scan_pages" in stats:
+        stats["font_scan_pages"] += len(scanned)
+    if pool:
+        # Each worker histograms its own chunks; the counts are merged here
+        with prof.stage("histogram"):
+            tasks = [(pdf_path, password, c, opts.cache_dir) for c in page_chunks(todo, workers)]
+            for counts in pool.map(_scan_chunk, tasks):
+                merge_stats(size_counts, counts)
+    elif opts.stream or page_cache:
+        # Histogram page by page (from the page cache where possible)
+        for pnum in todo:
+            with prof.stage("histogram", pnum):
+                merge_stats(size_counts, page_sizes(doc, pnum, page_cache, pages, opts.images, opts.tables))
+    else:
+        # Parse every page once; both the font histogram and the renderer use the result
+        for pnum in todo:
+            with prof.stage("histogram", pnum):
+                pages[pnum] = extract_page(doc[pnum], opts.images, tables=opts.tables)
+        with prof.stage("histogram"):
+            size_histogram((pages[pnum] for pnum in todo), size_counts)
+    # what is left of the OCR budget runs from here, where image OCR starts, to the end of rendering
+    ocr_deadline = time.time() + ocr_budget if ocr_budget is not None else None
+    if ocr:
+        ocr.deadline = ocr_deadline
+    ctx = {"classifier": heading_classifier(size_counts, outline), "images": opts.images, "tables": opts.tables,
+           "image_dir": opts.image_dir, "link_dir": opts.link_dir,
+           "page_cache": page_cache, "profile": Profile(prof.enabled), "scanned": scanned,
+           "saved_images": set(), "ocr_options": opts.ocr_options}
+
+    freq = {}
+    tags = set()
+    in_code = False
+    md = []          # markdown lines (whole document, or the current page when streaming)
+    part_file = opts.output_file + '.part'
+
+    if pool:
+        # each chunk only carries the OCR'd scanned pages it renders
+        tasks = [(pdf_path, password, c, dict(ctx, scanned={p: scanned[p] for p in c if p in scanned}),
+                  opts.ocr_workers, ocr_deadline) for c in chunks]
+        results = pool.map(_render_chunk, tasks)
+        firsts = [c[0] for c in chunks]
+    else:
+        results = (render_cached(doc, pnum, ctx, ocr, pages.pop(pnum, None) if pages else None)
+                   for pnum in pnums)
+        firsts = pnums
+    # pages that do not follow on from the previous selected page
+    breaks = {pnum for prev, pnum in zip(pnums, pnums[1:]) if pnum != prev + 1}
+    if ocr:
+        results = _resolved_in_order(results, ocr, lookahead=4 * ocr.workers)
+
+    try:
+        out = open(part_file, 'w', encoding='utf-8') if opts.stream else None
+        try:
+            # Process each page (or chunk of pages), in order
+            for first, page in zip(firsts, results):
+                merge_stats(stats, page.get("stats", {}))
+                if "profile" in page:
+                    prof.merge(page.pop("profile"))
+                if page_cache and not pool:
+                    page_cache.put(page)
+                for text in page["texts"]:
+                    count_terms(text, freq)
+                    find_tags(text, tags)
+                prune_terms(freq, opts.term_capacity)
+                if in_code and first in breaks:
+                    md.append('```')
+                    in_code = False
+                in_code = stitch_page(md, page, in_code)
+                if opts.stream:
+                    with prof.stage("write"):
+                        for line in md:
+                            # one record per line; embedded newlines (OCR text) are restored on read
+                            out.write(line.replace('\n', '\0') + '\n')
+                    md.clear()
+            if in_code:
+                md.append('```')
+            if opts.stream:
+                for line in md:
+                    out.write(line + '\n')
+                md.clear()
+        finally:
+            if out:
+                out.close()
+
+        # Wikilinks & tags (when streaming, the linking pass also writes the output)
+        with prof.stage("wikilinks"):
+            pattern = link_pattern(freq, opts.link_terms, opts.link_min_count)
+            if opts.stream:
+                with open(part_file, encoding='utf-8') as src, open(opts.output_file, 'w', encoding='utf-8') as f:
+                    for i, line in enumerate(src):
+                        f.write(('\n' if i else '') + link_line(line[:-1].replace('\0', '\n'), pattern))
+                    if tags:
+                        f.write('\n\n' + ' '.join(sorted(tags)))
+                os.remove(part_file)
+            else:
+                md = [link_line(line, pattern) for line in md]
+                if tags:
+                    md.append('\n'+ ' '.join(sorted(tags)))
+        if not opts.stream:
+            with prof.stage("write"):
+                with open(opts.output_file,'w',encoding='utf-8') as f:
+                    f.write('\n'.join(md))
+    except Exception as e:
+        print(f"Failed writing output: {e}",file=sys.stderr)
+        return False
+
+    merge_stats(stats, counter_delta(cache_before, ocr_cache_counters(opts.ocr_options)))
+    if not pool:
+        prof.merge(ctx["profile"].state())
+        merge_stats(stats, ctx["classifier"].counters())
+        if page_cache:
+            merge_stats(stats, page_cache.counters())
+    if opts.show_stats:
+        print_stats(stats)
+    print(f"Generated: {opts.output_file}")
+    return True
+
+
+def print_stats(stats):
+    """Print conversion counters to stderr."""
+    for k, v in stats.items():
+        print(f"{k:>24}: {v}", file=sys.stderr)
+
+
+def collect_batch(source):
+    """Resolve a batch source to (pdf_path, password, relative_md_path) entries.
+
+    `source` is a directory (searched recursively for *.pdf), a glob pattern,
+    or a manifest file listing one PDF per line as `path[<TAB>password]`
+    (blank lines and `#` comments are ignored, relative paths are resolved
+    against the manifest's directory).
+    """
+    entries = []
+    if os.path.isdir(source):
+        root = source
+        for dirpath, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith('.pdf'):
+                    entries.append((os.path.join(dirpath, name), None))
+    elif os.path.isfile(source) and not source.lower().endswith('.pdf'):
+        base = os.path.dirname(source)
+        with open(source, encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                path, _, password = line.partition('\t')
+                entries.append((os.path.join(base, path.strip()), password or None))
+        root = None
+    else:
+        entries = [(path, None) for path in sorted(glob.glob(source, recursive=True)) if os.path.isfile(path)]
+        root = None
+    if not entries:
+        return []
+    if root is None:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path, _ in entries])
+    return [(path, password, os.path.splitext(os.path.relpath(os.path.abspath(path), os.path.abspath(root)))[0] + '.md')
+            for path, password in entries]
+
+
+class BatchManifest:
+    """SQLite record of converted documents, so repeated batch runs skip the
+    ones whose input and conversion options are unchanged.
+
+    A document is up to date when its row has the same option hash, its
+    outputs still exist and its size and mtime match (one stat call); if
+    only the mtime changed, the content hash decides.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        import sqlite3   # only batch runs need it
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, size INTEGER,"
+                        " mtime_ns INTEGER, sha256 TEXT, options TEXT, outputs TEXT, converted REAL)")
+
+    def up_to_date(self, pdf_path, options_hash):
+        row = self.db.execute("SELECT size, mtime_ns, sha256, options, outputs FROM documents WHERE path = ?",
+                              (os.path.abspath(pdf_path),)).fetchone()
+        if not row or row[3] != options_hash or not all(map(os.path.exists, json.loads(row[4]))):
+            return False
+        try:
+            st = os.stat(pdf_path)
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) == (row[0], row[1]):
+            return True
+        if st.st_size == row[0] and file_sha256(pdf_path) == row[2]:
+            self.db.execute("UPDATE documents SET mtime_ns = ? WHERE path = ?", (st.st_mtime_ns, os.path.abspath(pdf_path)))
+            return True
+        return False
+
+    def record(self, pdf_path, stat, sha256, options_hash, outputs):
+        self.db.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (os.path.abspath(pdf_path), stat[0], stat[1], sha256, options_hash,
+                         json.dumps(outputs), time.time()))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# extract_pdf_to_markdown options that do not change the output
+RUNTIME_OPTIONS = ('stream', 'workers', 'ocr_workers', 'show_stats', 'cache_dir', 'profile', 'profile_pages')
+
+
+def options_hash(options):
+    """Hash of everything that affects a batch conversion's output."""
+    relevant = {k: v for k, v in options.items() if k not in RUNTIME_OPTIONS and k != 'ocr_options'}
+    settings = (PAGE_CACHE_VERSION, sorted(relevant.items()), ocr_settings(options.get('ocr_options', OcrOptions())))
+    return hashlib.sha256(repr(settings).encode()).hexdigest()
+
+
+def _batch_convert(task):
+    """Convert one batch entry, returning (ok, seconds, error message, (size, mtime_ns), sha256)."""
+    pdf_path, password, output_file, options = task
+    err = StringIO()
+    start = time.perf_counter()
+    stat = sha = None
+    try:
+        st = os.stat(pdf_path)
+        stat, sha = (st.st_size, st.st_mtime_ns), file_sha256(pdf_path)
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        with contextlib.redirect_stdout(StringIO()), contextlib.redirect_stderr(err):
+            ok = extract_pdf_to_markdown(pdf_path, password=password, output_file=output_file, **options)
+    except Exception as e:
+        ok = False
+        err.write(f"{type(e).__name__}: {e}")
+    return ok, time.perf_counter() - start, err.getvalue().strip().replace('\n', '; '), stat, sha
+
+
+def _batch_pool_results(tasks, jobs):
+    """Yield (task, _batch_convert result) for `tasks` run in a pool of `jobs` processes.
+
+    Only `jobs` tasks are handed to the pool at a time, so when a worker dies
+    (a MuPDF crash, an OOM kill) and breaks the pool, just those are suspects:
+    each is retried alone in a fresh process, a task whose process dies again
+    fails, and the rest of the batch goes on in a new pool.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+    died = "worker process died (crash or out of memory)"
+    queue = deque(tasks)
+    suspects = []
+    while queue or suspects:
+        if suspects:
+            task = suspects.pop()
+            start = time.perf_counter()
+            with concurrent.futures.ProcessPoolExecutor(1) as pool:
+                try:
+                    result = pool.submit(_batch_convert, task).result()
+                except BrokenProcessPool:
+                    result = (False, time.perf_counter() - start, died, None, None)
+            yield task, result
+            continue
+        pool = concurrent.futures.ProcessPoolExecutor(jobs)
+        running = {}
+        try:
+            while queue or running:
+                while queue and len(running) < jobs:
+                    task = queue.popleft()
+                    running[pool.submit(_batch_convert, task)] = task
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    task = running.pop(f)
+                    try:
+                        result = f.result()
+                    except BrokenProcessPool:
+                        suspects.append(task)
+                        continue
+                    except Exception as e:   # e.g. a task that cannot be pickled
+                        result = (False, 0.0, f"{type(e).__name__}: {e}", None, None)
+                    yield task, result
+                if suspects:
+                    suspects.extend(running.values())
+                    break
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+
+def convert_batch(source, out_dir, password=None, jobs=1, manifest=None, force=False, **options):
+    """Convert every PDF named by `source` into a mirrored tree under `out_dir`.
+
+    Files are converted by a pool of `jobs` processes with the given
+    extract_pdf_to_markdown `options`. Failures are reported in the summary
+    instead of stopping the run. Documents recorded in the `manifest`
+    database (default: .pdf-md-scan.sqlite in `out_dir`) as converted with the
+    same options and unchanged since are skipped unless `force` is set.
+    Returns the number of failures.
+    """
+    entries = collect_batch(source)
+    if not entries:
+        print(f"No PDFs found for: {source}", file=sys.stderr)
+        return 0
+    options = dict(options, workers=1)   # parallelism is per document here
+    opt_hash = options_hash(options)
+    db = BatchManifest(manifest or os.path.join(out_dir, '.pdf-md-scan.sqlite'))
+    tasks = [(pdf, pw or password, os.path.join(out_dir, rel), options) for pdf, pw, rel in entries]
+    skipped = 0
+    if not force:
+        todo = [task for task in tasks if not db.up_to_date(task[0], opt_hash)]
+        skipped = len(tasks) - len(todo)
+        tasks = todo
+    start = time.perf_counter()
+    failures = []
+    if jobs > 1 and tasks:
+        done = _batch_pool_results(tasks, jobs)
+    else:
+        done = ((task, _batch_convert(task)) for task in tasks)
+    try:
+        for task, (ok, secs, msg, stat, sha) in done:
+            print(f"{'ok  ' if ok else 'FAIL'} {secs:8.2f}s  {task[0]}" + ('' if ok else f"  ({msg})"))
+            if ok:
+                db.record(task[0], stat, sha, opt_hash, [task[2]])
+            else:
+                failures.append((task[0], msg))
+    finally:
+        done.close()
+        db.close()
+
+    print(f"\nConverted {len(tasks) - len(failures)}/{len(tasks)} PDFs in {time.perf_counter() - start:.2f}s"
+          f" ({len(failures)} failed, {skipped} up to date)")
+    for path, msg in failures:
+        print(f"  FAIL {path}: {msg}")
+    return len(failures)
+
+
+# --serve request options (query parameters): a str, a flag, an int or one of the listed values
+SERVE_FLAG = {'1': True, 'true': True, 'yes': True, '0': False, 'false': False, 'no': False}
+SERVE_OPTIONS = {'pages': str, 'images': SERVE_FLAG, 'tables': SERVE_FLAG, 'headings': ('fonts', 'outline'),
+                 'font_scan': ('full', 'sample'), 'links': SERVE_FLAG, 'ocr': SERVE_FLAG, 'ocr_lang': str, 'ocr_psm': int}
+SERVE_LATENCY_WINDOW = 1000   # latency percentiles cover the most recent requests
+
+
+def serve_request_options(query, ocr_options):
+    """Turn a --serve query string into (iter_markdown()/convert() keywords, whether
+    to add wikilinks). Raises ValueError for unknown or malformed parameters."""
+    from urllib.parse import parse_qsl
+    kwargs = {}
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        kind = SERVE_OPTIONS.get(name)
+        if kind is None:
+            raise ValueError(f"unknown option {name!r}")
+        if kind is SERVE_FLAG:
+            parsed = SERVE_FLAG.get(value.lower())
+        elif kind is int:
+            parsed = int(value) if value.isdigit() else None
+        elif kind is str:
+            parsed = value
+        else:
+            parsed = value if value in kind else None
+        if parsed is None:
+            raise ValueError(f"bad value for {name}: {value!r}")
+        kwargs[name] = parsed
+    links = kwargs.pop('links', False)
+    kwargs['ocr_options'] = ocr_options._replace(enabled=kwargs.pop('ocr', ocr_options.enabled),
+                                                 lang=kwargs.pop('ocr_lang', ocr_options.lang),
+                                                 psm=kwargs.pop('ocr_psm', ocr_options.psm))
+    return kwargs, links
+
+
+def _serve_worker(conn):
+    """Body of a --serve worker process: convert the PDFs sent over `conn`, one at a time.
+
+    A job is (pdf bytes, password, keywords, links); the reply is a series of
+    ("page", markdown) messages ended by ("done", stats) or ("error", message).
+    None asks the worker to exit.
+    """
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the server shuts workers down
+    numpy_available()
+    fitz.open().close()
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        data, password, kwargs, links = job
+        try:
+            if kwargs['ocr_options'].enabled:
+                ocr_available()
+            if links:
+                result = convert(data, password, **kwargs)
+                conn.send(("page", result.markdown))
+                stats = result.stats
+            else:
+                stats = {}
+                for md in iter_markdown(data, password, stats=stats, **kwargs):
+                    if md:
+                        conn.send(("page", md))
+            conn.send(("done", stats))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class WarmWorkers:
+    """Pre-forked --serve conversion processes that keep their imports loaded.
+
+    Each worker handles one request at a time over its own pipe; requests
+    wait (and count towards the queue depth) until a worker is idle. A
+    worker whose request did not finish cleanly (client gone, crash) is
+    replaced, since its pipe may still hold the rest of the reply.
+
+    Replacements are started from request handler threads, so workers are
+    forked by a single-threaded fork server (with this module and the
+    `preload` modules imported) rather than by the threaded server itself,
+    where a lock held by another thread at fork time could deadlock the child.
+    """
+
+    def __init__(self, count, preload=()):
+        import queue   # only --serve needs it
+        self.mp = mp_context(preload)
+        self.count = count
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.busy = 0
+        self.respawned = 0
+        for _ in range(count):
+            self.idle.put(self._spawn())
+
+    def _spawn(self):
+        parent, child = self.mp.Pipe()
+        proc = self.mp.Process(target=_serve_worker, args=(child,), daemon=True)
+        proc.start()
+        child.close()
+        return proc, parent
+
+    def _replace(self, worker):
+        worker[0].kill()
+        worker[0].join()
+        worker[1].close()
+        with self.lock:
+            self.respawned += 1
+        return self._spawn()
+
+    @contextlib.contextmanager
+    def worker(self):
+        """Wait for an idle worker and yield its pipe."""
+        with self.lock:
+            self.waiting += 1
+        worker = self.idle.get()
+        with self.lock:
+            self.waiting -= 1
+            self.busy += 1
+        if not worker[0].is_alive():   # died while idle (killed, out of memory)
+            worker = self._replace(worker)
+        clean = False
+        try:
+            yield worker[1]
+            clean = True
+        finally:
+            if not clean or not worker[0].is_alive():
+                worker = self._replace(worker)
+            with self.lock:
+                self.busy -= 1
+            self.idle.put(worker)
+
+    def close(self):
+        while not self.idle.empty():
+            proc, conn = self.idle.get()
+            with contextlib.suppress(OSError):
+                conn.send(None)
+            conn.close()
+            proc.join(1)
+            proc.kill()
+
+
+class ServeStats:
+    """Request counters and a sliding window of latencies for --serve's /stats."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "failed": 0, "pages": 0}
+        self.latencies = deque(maxlen=SERVE_LATENCY_WINDOW)
+
+    def record(self, seconds, ok, pages):
+        with self.lock:
+            merge_stats(self.counts, {"requests": 1, "failed": 0 if ok else 1, "pages": pages})
+            self.latencies.append(seconds)
+
+    def snapshot(self, workers):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            out = dict(self.counts)
+        with workers.lock:
+            out.update(workers=workers.count, busy=workers.busy, queue_depth=workers.waiting,
+                       respawned=workers.respawned)
+        # nearest-rank percentiles, in milliseconds
+        out["latency_ms"] = {f"p{q}": round(1000 * latencies[min(len(latencies) - 1, len(latencies) * q // 100)], 1)
+                             for q in (50, 90, 99)} if latencies else {}
+        return out
+
+
+def parse_serve_address(address):
+    """"HOST:PORT" (or just a port) -> ("tcp", (host, port)); "unix:PATH" or a path -> ("unix", path)."""
+    if address.startswith('unix:') or os.sep in address:
+        return "unix", address[5:] if address.startswith('unix:') else address
+    host, _, port = address.rpartition(':')
+    return "tcp", (host or '127.0.0.1', int(port))
+
+
+def serve(address="127.0.0.1:8765", workers=os.cpu_count() or 1, ocr_options=OcrOptions(), max_mb=256):
+    """Run the conversion daemon until interrupted.
+
+    POST /convert with the PDF as the request body (password in an
+    X-Password header, options such as ?pages=1-5&tables=0 in the query
+    string; see SERVE_OPTIONS) streams the Markdown back page by page as it
+    is rendered, without wikilinks unless ?links=1 (then it comes in one
+    piece). GET /stats returns the request counters, queue depth and
+    latency percentiles as JSON. Conversions run in `workers` pre-forked
+    processes, so requests skip interpreter start-up, imports and warm-up.
+    """
+    import http.server
+    import socketserver
+    kind, where = parse_serve_address(address)
+    # the fork server imports the optional dependencies once, so that every worker starts warm
+    preload = ["numpy"] if numpy_available() else []
+    if ocr_options.enabled and ocr_available():
+        preload += ["PIL.Image", "pytesseract"]
+    pool = WarmWorkers(max(1, workers), preload)
+    stats = ServeStats()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def handle(self):
+            with contextlib.suppress(ConnectionError):   # clients hanging up are not errors
+                super().handle()
+
+        def reply(self, code, body, content_type="text/plain; charset=utf-8"):
+            data = body.encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.split('?')[0] == '/stats':
+                self.reply(200, json.dumps(stats.snapshot(pool)), "application/json")
+            else:
+                self.reply(404, "not found\n")
+
+        def do_POST(self):
+            path, _, query = self.path.partition('?')
+            if path != '/convert':
+                return self.reply(404, "not found\n")
+            length = self.headers.get('Content-Length')
+            if length is None or not length.isdigit():
+                return self.reply(411, "Content-Length required\n")
+            if int(length) > max_mb * 2**20:
+                self.close_connection = True
+                return self.reply(413, f"PDF larger than {max_mb} MB\n")
+            data = self.rfile.read(int(length))
+            start = time.perf_counter()
+            pages = sent = 0
+            streaming = ok = False
+            try:
+                try:
+                    kwargs, links = serve_request_options(query, ocr_options)
+                except ValueError as e:
+                    self.reply(400, f"{e}\n")
+                    return
+                with pool.worker() as conn:
+                    conn.send((data, self.headers.get('X-Password'), kwargs, links))
+                    tag, value = conn.recv()
+                    if tag == "error":
+                        self.reply(400 if value.startswith("ValueError") else 422, f"{value}\n")
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/markdown; charset=utf-8")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    streaming = True
+                    while tag == "page":
+                        data = (('\n' if sent else '') + value).encode('utf-8')
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data) if data else b"")
+                        self.wfile.flush()
+                        sent += 1
+                        tag, value = conn.recv()
+                    if tag == "error":
+                        # an unterminated chunked body tells the client the Markdown is incomplete
+                        self.close_connection = True
+                        return
+                    self.wfile.write(b"0\r\n\r\n")
+                    pages = value.get("pages", 0)
+                    ok = True
+            except (EOFError, ConnectionError) as e:
+                # the worker died or the client went away; the worker has been replaced
+                self.close_connection = True
+                if not streaming:
+                    self.reply(500, f"conversion worker failed: {type(e).__name__}\n")
+            finally:
+                stats.record(time.perf_counter() - start, ok, pages)
+
+    if kind == "unix":
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+            request_queue_size = 128   # requests queue for a worker, not in the listen backlog
+
+            def get_request(self):
+                conn, _ = super().get_request()
+                return conn, ("unix", 0)   # BaseHTTPRequestHandler expects a (host, port) address
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(where)
+    else:
+        class Server(http.server.ThreadingHTTPServer):
+            request_queue_size = 128
+    try:
+        server = Server(where, Handler)
+    except OSError as e:
+        pool.close()
+        print(f"Cannot listen on {address}: {e}", file=sys.stderr)
+        return False
+    print(f"Serving on {address} with {pool.count} warm worker(s)", file=sys.stderr)
+    if threading.current_thread() is threading.main_thread():
+        import signal
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))   # shut down cleanly, like Ctrl-C
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if kind == "unix":
+            with contextlib.suppress(OSError):
+                os.remove(where)
+    return True
+
+
+def main(argv=None):
+    """The command line (run through pdf-md-scan.py)."""
+    p=argparse.ArgumentParser()
+    p.add_argument('input_pdf',nargs='?',help='PDF file, or with --batch a directory, glob or manifest file')
+    p.add_argument('-p','--password',default=None)
+    p.add_argument('-o','--output',default=None,help='output Markdown file (default: output.md), or with --batch the output directory (default: md)')
+    p.add_argument('--ocr',action='store_true')
+    p.add_argument('--ocr-lang',default='eng',help='Tesseract language(s), e.g. eng+deu')
+    p.add_argument('--ocr-psm',type=int,default=3,help='Tesseract page segmentation mode for images (not scanned pages)')
+    p.add_argument('--no-ocr-preprocess',dest='ocr_preprocess',action='store_false',
+                   help='give images to Tesseract as they are (no grayscale/downscale/binarize/crop)')
+    p.add_argument('--ocr-line-height',type=int,default=48,metavar='PX',
+                   help='downscale images for OCR until text lines are about PX pixels tall (default 48)')
+    p.add_argument('--ocr-threshold',type=float,default=0.15,
+                   help='adaptive binarization: ink is this much darker than its surroundings (default 0.15)')
+    p.add_argument('--ocr-cache',nargs='?',const=os.path.join(os.path.expanduser('~'),'.cache','pdf-md-scan','ocr'),
+                   default=None,metavar='DIR',help='reuse OCR results of identical images across runs')
+    p.add_argument('--ocr-cache-size',type=float,default=256,metavar='MB',help='OCR cache size limit (default: 256)')
+    p.add_argument('--ocr-workers',type=int,default=os.cpu_count() or 1,help='OCR up to N images concurrently')
+    p.add_argument('--ocr-budget',type=float,default=None,help='max seconds of image OCR per document, counted from when OCR starts')
+    p.add_argument('--stream',action='store_true',help='write pages as they are rendered (bounded memory)')
+    p.add_argument('--workers',type=int,default=1,help='render pages in N processes')
+    p.add_argument('--image-dir',default=None,help='where to store extracted images (default: next to the output file)')
+    p.add_argument('--no-images',dest='images',action='store_false',help='skip images (no files, links or OCR)')
+    p.add_argument('--no-tables',dest='tables',action='store_false',help='keep table cells as text lines instead of Markdown tables')
+    p.add_argument('--link-terms',type=int,default=20,metavar='K',help='wikilink the K most frequent terms (default: 20)')
+    p.add_argument('--link-min-count',type=int,default=2,metavar='N',help='only wikilink terms seen at least N times (default: 2)')
+    p.add_argument('--term-capacity',type=int,default=100000,metavar='N',help='max distinct terms tracked for wikilinks')
+    p.add_argument('--page-cache',default=None,metavar='DIR',help='reuse rendered pages whose content is unchanged since an earlier run')
+    p.add_argument('--pages',default=None,metavar='RANGES',
+                   help='only convert these pages, e.g. "1-20,150,400-" (1-based, inclusive)')
+    p.add_argument('--headings',choices=('fonts','outline'),default='fonts',
+                   help="take headings from font sizes or from the PDF's bookmark outline (falls back to fonts)")
+    p.add_argument('--font-scan',choices=('full','sample'),default='full',
+                   help='build the font-size histogram from every page or from a converging sample')
+    p.add_argument('--profile',type=int,nargs='?',const=10,default=None,metavar='N',
+                   help='print the time spent in each stage and the N slowest pages (default 10)')
+    p.add_argument('--stats',action='store_true',help='print conversion counters to stderr')
+    p.add_argument('--batch',action='store_true',help='convert many PDFs into a mirrored output tree')
+    p.add_argument('--jobs',type=int,default=os.cpu_count() or 1,
+                   help='with --batch, convert N PDFs at a time; with --serve, keep N warm worker processes')
+    p.add_argument('--serve',nargs='?',const='127.0.0.1:8765',default=None,metavar='ADDR',
+                   help='run a conversion daemon on HOST:PORT or unix:PATH (default 127.0.0.1:8765)')
+    p.add_argument('--manifest',default=None,help='with --batch, database of converted PDFs (default: <output>/.pdf-md-scan.sqlite)')
+    p.add_argument('--force',action='store_true',help='with --batch, reconvert PDFs even if they are up to date')
+    args=p.parse_args(argv)
+    ocr_options=OcrOptions(args.ocr, args.ocr_lang, args.ocr_psm,
+                           (args.ocr_line_height, args.ocr_threshold) if args.ocr_preprocess else None,
+                           OcrCache(args.ocr_cache, int(args.ocr_cache_size * 2**20)) if args.ocr and args.ocr_cache else None)
+    if args.ocr and not ocr_available():
+        print("OCR dependencies missing; skipping OCR.",file=sys.stderr)
+    options=dict(stream=args.stream, workers=args.workers,
+                 ocr_workers=args.ocr_workers, ocr_budget=args.ocr_budget, show_stats=args.stats,
+                 image_dir=args.image_dir, images=args.images, tables=args.tables, link_terms=args.link_terms,
+                 link_min_count=args.link_min_count, term_capacity=args.term_capacity,
+                 cache_dir=args.page_cache, profile=args.profile is not None, profile_pages=args.profile or 0,
+                 pages=args.pages, font_scan=args.font_scan, headings=args.headings, ocr_options=ocr_options)
+    if args.serve:
+        sys.exit(0 if serve(args.serve, args.jobs, ocr_options) else 1)
+    if not args.input_pdf:
+        p.error('the following arguments are required: input_pdf')
+    if args.batch:
+        failed = convert_batch(args.input_pdf, args.output or 'md', password=args.password, jobs=args.jobs,
+                               manifest=args.manifest, force=args.force, **options)
+        sys.exit(1 if failed else 0)
+    extract_pdf_to_markdown(args.input_pdf, password=args.password, output_file=args.output or 'output.md', **options)
+
+
+if __name__=='__main__':
+    main()
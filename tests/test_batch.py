@@ -0,0 +1,45 @@
+"""--batch: a PDF that kills its worker process fails alone; the rest of the batch is converted."""
+import io
+import os
+import sys
+import tempfile
+import contextlib
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+from bench import make_pdf  # noqa: E402
+
+convert_one = m._batch_convert
+
+
+def crashing_convert(task):
+    """_batch_convert, except that the worker dies (like a MuPDF segfault) on crash.pdf."""
+    if os.path.basename(task[0]) == "crash.pdf":
+        os._exit(1)
+    return convert_one(task)
+
+
+class BatchWorkerCrashTest(unittest.TestCase):
+    def test_crashed_worker_fails_only_its_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src, out = os.path.join(tmp, "in"), os.path.join(tmp, "out")
+            os.makedirs(src)
+            names = [f"doc{i}" for i in range(6)] + ["crash"]
+            for name in names:
+                make_pdf(os.path.join(src, name + ".pdf"), 2, images=False)
+            m._batch_convert = crashing_convert
+            self.addCleanup(setattr, m, "_batch_convert", convert_one)
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                failures = m.convert_batch(src, out, jobs=3)
+            self.assertEqual(failures, 1, log.getvalue())
+            self.assertIn("Converted 6/7 PDFs", log.getvalue())
+            self.assertIn("crash.pdf: worker process died", log.getvalue())
+            self.assertEqual(sorted(f for f in os.listdir(out) if f.endswith(".md")),
+                             [f"doc{i}.md" for i in range(6)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Conversions with different OCR, table and image settings running in threads
+of one process must give the same results as when run one after another."""
+import io
+import os
+import sys
+import hashlib
+import itertools
+import tempfile
+import contextlib
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+from bench import make_pdf  # noqa: E402
+
+
+def fake_tesseract(img, lang, config):
+    """Deterministic stand-in for pytesseract.image_to_string: the text depends
+    on the pixels handed over and on the settings, so crossed options show."""
+    return f"{lang} {config} {hashlib.sha256(img.tobytes()).hexdigest()[:8]}"
+
+
+def make_table_pdf(path):
+    """One page with a ruled and an unruled table between paragraphs."""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "Quarterly Report", fontsize=20)
+    x, top = [50, 180, 300, 420], 100
+    rows = [["Region", "Q1", "Q2"], ["North", "120", "130"], ["South", "90", "95"], ["East", "70", "80"]]
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row):
+            page.insert_text((x[j] + 4, top + i * 20 + 14), cell, fontsize=11)
+    for i in range(len(rows) + 1):
+        page.draw_line((x[0], top + i * 20), (x[-1], top + i * 20))
+    for xx in x:
+        page.draw_line((xx, top), (xx, top + len(rows) * 20))
+    y = top + len(rows) * 20 + 40
+    page.insert_text((50, y), "Text between the tables.", fontsize=11)
+    rows = [["Name", "Role", "Years"], ["Alice Smith", "Engineer", "5"], ["Bob", "Manager", "12"], ["Carol", "Analyst", "3"]]
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row):
+            page.insert_text((50 + j * 150, y + 30 + i * 16), cell, fontsize=11)
+    doc.save(path)
+    doc.close()
+
+
+@unittest.skipUnless(m.ocr_available(), "pillow/pytesseract not installed")
+class ConcurrentConversionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        saved = m.pytesseract.image_to_string, m.tesseract_version
+        self.addCleanup(lambda: setattr(m.pytesseract, "image_to_string", saved[0]))
+        self.addCleanup(lambda: setattr(m, "tesseract_version", saved[1]))
+        m.pytesseract.image_to_string = fake_tesseract
+        m.tesseract_version = lambda: "fake"
+
+        files = [os.path.join(self.tmp.name, name) for name in ("images.pdf", "tables.pdf")]
+        make_pdf(files[0], 8)
+        make_table_pdf(files[1])
+        cache = m.OcrCache(os.path.join(self.tmp.name, "ocr-cache"))
+        ocrs = [m.OcrOptions(), m.OcrOptions(True), m.OcrOptions(True, "deu", 6), m.OcrOptions(True, preprocess=None),
+                m.OcrOptions(True, preprocess=(24, 0.3), cache=cache)]
+        self.jobs = list(itertools.product(files, ocrs, [(True, True), (False, True), (True, False)]))
+
+    def library(self, job):
+        path, ocr_options, (tables, images) = job
+        result = m.convert(path, tables=tables, images=images, ocr_options=ocr_options)
+        return result.markdown, sorted(result.images)
+
+    def cli(self, job, n, run):
+        path, ocr_options, (tables, images) = job
+        out_dir = os.path.join(self.tmp.name, f"{run}-{n}")
+        os.makedirs(out_dir)
+        output = os.path.join(out_dir, "out.md")
+        self.assertTrue(m.extract_pdf_to_markdown(path, output_file=output, tables=tables, images=images,
+                                                  ocr_options=ocr_options, ocr_workers=2))
+        with open(output, encoding="utf-8") as f:
+            return f.read(), sorted(os.listdir(out_dir))
+
+    def test_threads_match_sequential_runs(self):
+        n = range(len(self.jobs))
+        with contextlib.redirect_stdout(io.StringIO()):
+            library = [self.library(job) for job in self.jobs]
+            cli = [self.cli(job, i, "seq") for job, i in zip(self.jobs, n)]
+            for run in range(2):
+                with ThreadPoolExecutor(8) as pool:
+                    self.assertEqual(list(pool.map(self.library, self.jobs)), library)
+                    self.assertEqual(list(pool.map(self.cli, self.jobs, n, itertools.repeat(run))), cli)
+        # the settings really differ: OCR lines for some jobs, tables for others
+        self.assertTrue(any("> OCR: deu --psm 6" in md for md, _ in library))
+        self.assertTrue(any("> OCR: eng --psm 3" in md for md, _ in library))
+        self.assertTrue(any(md.startswith("| ") or "\n| " in md for md, _ in library))
+
+
+class WorkerStartTest(unittest.TestCase):
+    def test_pools_do_not_fork_the_caller(self):
+        pool = m.process_pool(2)
+        self.addCleanup(pool.shutdown)
+        self.assertIn(pool._mp_context.get_start_method(), ("forkserver", "spawn"))
+        self.assertEqual(list(pool.map(m.parse_page_ranges, ["1-2", "3"], [5, 5])), [[0, 1], [2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
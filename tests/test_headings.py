@@ -0,0 +1,59 @@
+"""--headings outline: bookmark titles that wrap, and bold body-size subheadings."""
+import os
+import sys
+import unittest
+
+import fitz  # PyMuPDF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+
+BODY = "The assessment reviewed controls across the network and recorded each finding."
+
+
+def outline_pdf():
+    """Two bookmarked chapters, the second with its title wrapped over two lines,
+    each with a bold body-size subheading."""
+    doc = fitz.open()
+    for title in (["Introduction"], ["Scope and", "Limitations"]):
+        page = doc.new_page()
+        y = 60
+        for part in title:
+            page.insert_text((72, y), part, fontsize=18, fontname="hebo")
+            y += 24
+        for _ in range(12):
+            page.insert_text((72, y), BODY, fontsize=11)
+            y += 15
+        page.insert_text((72, y + 10), "Important Note", fontsize=11, fontname="hebo")
+        y += 30
+        for _ in range(6):
+            page.insert_text((72, y), BODY, fontsize=11)
+            y += 15
+    doc.set_toc([[1, "Introduction", 1], [1, "Scope and Limitations", 2]])
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def headings(data, mode):
+    return [line for line in m.convert(data, headings=mode, link_terms=0).markdown.splitlines()
+            if line.startswith("#") and not line.startswith("#a")]
+
+
+class OutlineHeadingsTest(unittest.TestCase):
+    def test_wrapped_title_and_subheadings(self):
+        data = outline_pdf()
+        self.assertEqual(headings(data, "outline"), ["### Introduction", "#### Important Note",
+                                                     "### Scope and Limitations", "#### Important Note"])
+
+    def test_join_titles_only_joins_whole_titles(self):
+        classifier = m.LineClassifier({}, 11.0, {0: {"scope and limitations": 3}})
+        line = [m.Span("Scope and", 18.0, "Helvetica-Bold", 0, (72, 40, 160, 62))]
+        other = [m.Span("Other text", 11.0, "Helvetica", 0, (72, 64, 160, 76))]
+        self.assertEqual(classifier.join_titles([line, other], 0), [line, other])
+        self.assertEqual(classifier.join_titles([line, other], 1), [line, other])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,22 @@
+"""Start-up cost: `pdf-md-scan.py --help` must not import the OCR or table stacks."""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench import import_times  # noqa: E402
+
+MAX_IMPORT_MS = 2000   # generous: a cold start is a few hundred ms, mostly PyMuPDF
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_help_skips_heavy_imports(self):
+        total, slowest, modules = import_times(runs=3)
+        for heavy in ("PIL", "pytesseract", "numpy"):
+            self.assertFalse([name for name in modules if name.split(".")[0] == heavy], f"{heavy} imported by --help")
+        self.assertLess(total, MAX_IMPORT_MS, slowest)
+
+
+if __name__ == "__main__":
+    unittest.main()
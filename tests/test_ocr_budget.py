@@ -0,0 +1,67 @@
+"""--ocr-budget and --page-cache: pages whose OCR was cut short must not be cached."""
+import os
+import sys
+import time
+import hashlib
+import multiprocessing
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+from bench import make_pdf  # noqa: E402
+
+
+def slow_tesseract(img, lang, config):
+    """Deterministic stand-in for pytesseract.image_to_string that takes a while."""
+    time.sleep(0.1)
+    return f"{lang} {hashlib.sha256(img.tobytes()).hexdigest()[:8]}"
+
+
+@unittest.skipUnless(m.ocr_available(), "pillow/pytesseract not installed")
+class OcrBudgetCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.pdf = os.path.join(self.tmp.name, "in.pdf")
+        make_pdf(self.pdf, 6)
+        saved = m.pytesseract.image_to_string, m.tesseract_version
+        self.addCleanup(lambda: setattr(m.pytesseract, "image_to_string", saved[0]))
+        self.addCleanup(lambda: setattr(m, "tesseract_version", saved[1]))
+        m.pytesseract.image_to_string = slow_tesseract
+        m.tesseract_version = lambda: "fake"
+
+    def ocr_lines(self, **options):
+        out = os.path.join(self.tmp.name, "out.md")
+        self.assertTrue(m.extract_pdf_to_markdown(self.pdf, output_file=out, ocr_workers=1, ocr_options=m.OcrOptions(True),
+                                                  **options))
+        with open(out, encoding="utf-8") as f:
+            return sum(line.startswith("> OCR:") for line in f)
+
+    def test_budgeted_pages_are_not_cached(self):
+        full = self.ocr_lines()
+        cache = os.path.join(self.tmp.name, "cache")
+        self.assertLess(self.ocr_lines(cache_dir=cache, ocr_budget=0.25), full)
+        self.assertEqual(self.ocr_lines(cache_dir=cache), full)
+        self.assertEqual(self.ocr_lines(cache_dir=cache, workers=2), full)
+
+    def test_budget_starts_with_ocr(self):
+        full = self.ocr_lines()
+        heading_source = m.heading_source
+
+        def slow_analysis(*args, **kwargs):   # as slow as a large document's font histogram
+            time.sleep(2)
+            return heading_source(*args, **kwargs)
+        m.heading_source = slow_analysis
+        self.addCleanup(setattr, m, "heading_source", heading_source)
+        self.assertEqual(self.ocr_lines(ocr_budget=2.5), full)
+        # forked workers inherit the Tesseract stand-in; fork-server ones would not
+        mp_context = m.mp_context
+        m.mp_context = lambda preload=(): multiprocessing.get_context("fork")
+        self.addCleanup(setattr, m, "mp_context", mp_context)
+        self.assertEqual(self.ocr_lines(ocr_budget=2.5, workers=2), full)
+
+
+if __name__ == "__main__":
+    unittest.main()
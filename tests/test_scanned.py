@@ -0,0 +1,100 @@
+"""Full-page OCR of scanned pages: the OCR cache and --ocr-budget apply to it."""
+import io
+import os
+import sys
+import time
+import weakref
+import tempfile
+import contextlib
+import unittest
+
+import fitz  # PyMuPDF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+
+
+def scanned_pdf(path, pages):
+    """`pages` pages that are each a single full-page image of some text, with no text layer."""
+    doc = fitz.open()
+    for n in range(pages):
+        src = fitz.open()
+        page = src.new_page()
+        page.insert_text((72, 72), f"Scanned page {n + 1}", fontsize=18)
+        pix = page.get_pixmap(dpi=150)
+        doc.new_page().insert_image(doc[-1].rect, pixmap=pix)
+        src.close()
+    doc.save(path)
+    doc.close()
+
+
+class FakeOcr:
+    """Stand-in for Page.get_textpage_ocr (MuPDF's Tesseract): a text page with a
+    heading and a line of text, taking `delay` seconds per page."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.docs = []
+
+    def __call__(self, page, flags=0, language="eng", dpi=72, full=False, tessdata=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        doc = fitz.open()
+        layer = doc.new_page(width=page.rect.width, height=page.rect.height)
+        layer.insert_text((72, 72), f"Chapter {page.number + 1}", fontsize=18)
+        layer.insert_text((72, 100), f"{language} text recognised on page {page.number + 1}", fontsize=11)
+        textpage = layer.get_textpage(flags=flags)
+        textpage.parent = weakref.proxy(page)
+        self.docs.append(doc)
+        return textpage
+
+
+@unittest.skipUnless(m.ocr_available(), "pillow/pytesseract not installed")
+class ScannedPageOcrTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.pdf = os.path.join(self.tmp.name, "scan.pdf")
+        scanned_pdf(self.pdf, 4)
+        saved = fitz.Page.get_textpage_ocr
+        self.addCleanup(setattr, fitz.Page, "get_textpage_ocr", saved)
+
+    def convert(self, fake, **options):
+        fitz.Page.get_textpage_ocr = lambda page, **kwargs: fake(page, **kwargs)
+        out = os.path.join(self.tmp.name, "out.md")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            self.assertTrue(m.extract_pdf_to_markdown(self.pdf, output_file=out, ocr_workers=1, link_terms=0,
+                                                      **options))
+        with open(out, encoding="utf-8") as f:
+            return f.read()
+
+    def test_cached_layout(self):
+        options = m.OcrOptions(True, cache=m.OcrCache(os.path.join(self.tmp.name, "cache")))
+        first, second = FakeOcr(), FakeOcr()
+        md = self.convert(first, ocr_options=options)
+        self.assertEqual(first.calls, 4)
+        self.assertIn("### Chapter 4", md)
+        self.assertEqual(self.convert(second, ocr_options=options), md)
+        self.assertEqual(second.calls, 0)
+
+    def test_library_matches_cli(self):
+        fake = FakeOcr()
+        md = self.convert(fake, ocr_options=m.OcrOptions(True))
+        result = m.convert(self.pdf, link_terms=0, ocr_options=m.OcrOptions(True))
+        self.assertEqual(result.markdown, md)
+        self.assertEqual(result.stats["scanned_pages"], 4)
+        self.assertEqual(fake.calls, 8)
+
+    def test_budget(self):
+        fake = FakeOcr(delay=0.4)
+        md = self.convert(fake, ocr_options=m.OcrOptions(True), ocr_budget=0.6)
+        self.assertEqual(fake.calls, 2)
+        self.assertIn("text recognised on page 2", md)
+        self.assertNotIn("text recognised on page 3", md)
+        self.assertEqual(md.count("![]("), 2)   # the skipped pages keep their image
+
+
+if __name__ == "__main__":
+    unittest.main()
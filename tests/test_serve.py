@@ -0,0 +1,64 @@
+"""--serve: streamed conversions, request errors, and the /stats counters that cover both."""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+from bench import make_pdf, serve_request, UnixConnection  # noqa: E402
+
+
+class ServeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        pdf = os.path.join(cls.tmp.name, "in.pdf")
+        make_pdf(pdf, 6)
+        with open(pdf, "rb") as f:
+            cls.pdf = f.read()
+        cls.sock = os.path.join(cls.tmp.name, "serve.sock")
+        cls.server = subprocess.Popen([sys.executable, "-c", f"import pdf_md_scan; pdf_md_scan.serve({cls.sock!r}, 2)"],
+                                      cwd=ROOT, stderr=subprocess.DEVNULL)
+        for _ in range(200):
+            if os.path.exists(cls.sock):
+                break
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        cls.tmp.cleanup()
+
+    def test_requests_and_stats(self):
+        conn = UnixConnection(self.sock)
+        try:
+            conn.request("POST", "/convert?images=0", self.pdf)
+            response = conn.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader("Transfer-Encoding"), "chunked")
+            md = response.read().decode("utf-8")
+        finally:
+            conn.close()
+        self.assertEqual(md, '\n'.join(page for page in m.iter_markdown(self.pdf, images=False) if page))
+
+        status, body = serve_request(self.sock, "POST", "/convert?tables=maybe", self.pdf)
+        self.assertEqual((status, body), (400, b"bad value for tables: 'maybe'\n"))
+        status, body = serve_request(self.sock, "POST", "/convert", b"not a pdf")
+        self.assertEqual(status, 422, body)
+
+        status, body = serve_request(self.sock, "GET", "/stats")
+        self.assertEqual(status, 200)
+        stats = json.loads(body)
+        self.assertEqual({k: stats[k] for k in ("requests", "failed", "pages", "workers", "busy", "queue_depth")},
+                         {"requests": 3, "failed": 2, "pages": 6, "workers": 2, "busy": 0, "queue_depth": 0})
+        self.assertEqual(sorted(stats["latency_ms"]), ["p50", "p90", "p99"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Unruled table detection: aligned columns become pipe tables, hanging-indent lists do not."""
+import os
+import sys
+import unittest
+
+import fitz  # PyMuPDF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+
+ITEMS = ["Firewall rules reviewed", "Patch levels verified", "Access logs retained", "Backups tested"]
+
+
+def pdf_bytes(rows, x, header_font="helv"):
+    """One page with a heading and `rows` of cells starting at the `x` positions."""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 60), "Findings", fontsize=16, fontname="hebo")
+    for i, row in enumerate(rows):
+        for cell, left in zip(row, x):
+            page.insert_text((left, 100 + i * 16), cell, fontsize=11, fontname=header_font if i == 0 else "helv")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def markdown(data):
+    return m.convert(data, link_terms=0).markdown
+
+
+@unittest.skipUnless(m.numpy_available(), "numpy not installed")
+class UnruledTableTest(unittest.TestCase):
+    def test_numbered_list_with_wide_indent(self):
+        md = markdown(pdf_bytes([[f"{i + 1}.", item] for i, item in enumerate(ITEMS)], (72, 100)))
+        self.assertNotIn("|", md)
+        self.assertEqual([line.strip() for line in md.splitlines()[1:]], [f"{i + 1}. {item}" for i, item in enumerate(ITEMS)])
+
+    def test_bullet_list_with_wide_indent(self):
+        for bullet in ("-", "•"):
+            md = markdown(pdf_bytes([[bullet, item] for item in ITEMS], (72, 100)))
+            self.assertNotIn("|", md)
+            self.assertEqual([line.strip() for line in md.splitlines()[1:]], [f"- {item}" for item in ITEMS])
+
+    def test_two_columns_need_a_header(self):
+        rows = [["Control", "Owner"], ["Firewall", "Network team"], ["Backups", "Operations"], ["Logging", "Security"]]
+        self.assertNotIn("|", markdown(pdf_bytes(rows, (72, 200))))
+        md = markdown(pdf_bytes(rows, (72, 200), header_font="hebo"))
+        self.assertIn("| Control | Owner |\n| --- | --- |\n| Firewall | Network team |", md)
+        rows = [["Year", "Findings"], ["2021", "14"], ["2022", "9"], ["2023", "6"]]
+        self.assertIn("| Year | Findings |\n| --- | --- |", markdown(pdf_bytes(rows, (72, 200))))
+
+    def test_three_columns(self):
+        rows = [["Name", "Role", "Years"], ["Alice Smith", "Engineer", "5"], ["Bob", "Manager", "12"], ["Carol", "Analyst", "3"]]
+        md = markdown(pdf_bytes(rows, (72, 222, 372)))
+        self.assertIn("| Name | Role | Years |\n| --- | --- | --- |\n| Alice Smith | Engineer | 5 |", md)
+
+
+if __name__ == "__main__":
+    unittest.main()
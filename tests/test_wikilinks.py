@@ -0,0 +1,32 @@
+"""Wikilinks must not touch image link paths."""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pdf_md_scan as m  # noqa: E402
+from bench import make_pdf  # noqa: E402
+
+
+class ImageLinkTest(unittest.TestCase):
+    def test_link_line_skips_image_links(self):
+        pattern = m.term_regex(["finding"])
+        self.assertEqual(m.link_line("![](finding/ab12.png)", pattern), "![](finding/ab12.png)")
+        self.assertEqual(m.link_line("One finding here", pattern), "One [[finding]] here")
+
+    def test_image_dir_named_after_a_term(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf, out = os.path.join(tmp, "in.pdf"), os.path.join(tmp, "out.md")
+            make_pdf(pdf, 10)
+            self.assertTrue(m.extract_pdf_to_markdown(pdf, output_file=out, image_dir=os.path.join(tmp, "finding"),
+                                                      link_terms=100))
+            with open(out, encoding="utf-8") as f:
+                links = [line for line in f if line.startswith("![](")]
+            self.assertTrue(links)
+            self.assertTrue(all(line.startswith("![](finding/") for line in links), links[:3])
+
+
+if __name__ == "__main__":
+    unittest.main()